@@ -0,0 +1,172 @@
+"""
+
+Animations encoded directly from the rendered frames
+
+The frames of a Matplotlib figure are taken as RGB arrays from the canvas
+(see frame_rgb) and streamed to an encoder, without writing an image file for
+every frame:
+
+    FFmpegWriter    :: Videos (e.g. .mp4, .webm, .avi), piping the raw RGB
+                       frames to an ffmpeg process, which must be installed
+
+    GIFWriter       :: Animated GIFs, saved with Pillow (a dependency of
+                       Matplotlib). The frames are quantised to an adaptive
+                       palette when they are encoded and the file is saved
+                       when the writer is closed
+
+The encoding of a frame (the encode function of the writer classes) is
+separated from the writing of the file, so the frames can be rendered and
+encoded by a pool of processes while the main process writes them in order:
+
+    writer = animation_writer('band.gif', width, height, fps=10)
+    for data in pool.imap(render_and_encode, frames):
+        writer.write(data)
+    writer.close()
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+# Pillow is installed with Matplotlib
+from PIL import Image
+
+import os
+import subprocess
+
+
+def frame_rgb(fig):
+    """
+    Draw a Matplotlib figure (with the Agg canvas) and return a copy of its
+    pixels as an RGB array of shape (height, width, 3)
+    """
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    rgba = np.frombuffer(fig.canvas.buffer_rgba(), dtype=np.uint8)
+
+    return np.array(rgba.reshape(height, width, 4)[:, :, :3])
+
+
+# GIF -------------------------------------------------------------------------
+
+def gif_frame(rgb, fps=10):
+    """
+    Pillow image of an RGB array with an adaptive palette of 256 colours
+    """
+    return Image.fromarray(np.ascontiguousarray(rgb, dtype=np.uint8),
+                           'RGB').convert('P', palette=Image.ADAPTIVE)
+
+
+class GIFWriter(object):
+    """
+    Animated GIF, saved by Pillow when the writer is closed
+
+    path        :: File name
+
+    width,
+    height      :: Size of the frames in pixels
+
+    fps         :: Frames per second
+
+    loop        :: Number of repetitions of the animation, 0 to repeat it
+                   forever
+
+    """
+
+    encode = staticmethod(gif_frame)
+
+    def __init__(self, path, width, height, fps=10, loop=0):
+        self.path = path
+        self.fps = fps
+        self.loop = loop
+        self._frames = []
+
+    def write(self, data):
+        """
+        Add an encoded frame (see gif_frame)
+        """
+        self._frames.append(data)
+
+    def write_frame(self, rgb):
+        self.write(self.encode(rgb, self.fps))
+
+    def close(self):
+        if self._frames:
+            self._frames[0].save(self.path, save_all=True,
+                                 append_images=self._frames[1:],
+                                 duration=int(round(1000. / self.fps)),
+                                 loop=self.loop)
+        self._frames = []
+
+# -----------------------------------------------------------------------------
+
+
+# Video -----------------------------------------------------------------------
+
+def raw_frame(rgb, fps=10):
+    """
+    Bytes of an RGB array, as read by ffmpeg
+    """
+    return np.ascontiguousarray(rgb, dtype=np.uint8).tobytes()
+
+
+class FFmpegWriter(object):
+    """
+    Video encoded by an ffmpeg process, which receives the raw RGB frames
+    through a pipe. The frames are padded to even sizes, which are required
+    by the yuv420p pixel format of most players
+
+    path        :: File name, the container and codec are chosen by ffmpeg
+                   from its extension
+
+    width,
+    height      :: Size of the frames in pixels
+
+    fps         :: Frames per second
+
+    """
+
+    encode = staticmethod(raw_frame)
+
+    def __init__(self, path, width, height, fps=10):
+        self.path = path
+        self.fps = fps
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                   '-s', '{}x{}'.format(width, height),
+                   '-r', str(fps), '-i', '-',
+                   '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                   '-pix_fmt', 'yuv420p', path]
+        try:
+            self._process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        except OSError:
+            raise OSError('ffmpeg is required to save {}'.format(path))
+
+    def write(self, data):
+        """
+        Write an encoded frame (see raw_frame)
+        """
+        self._process.stdin.write(data)
+
+    def write_frame(self, rgb):
+        self.write(self.encode(rgb, self.fps))
+
+    def close(self):
+        self._process.stdin.close()
+        if self._process.wait() != 0:
+            raise RuntimeError('ffmpeg failed to save {}'.format(self.path))
+
+# -----------------------------------------------------------------------------
+
+
+def writer_class(path):
+    """
+    GIFWriter for .gif files, FFmpegWriter otherwise
+    """
+    if os.path.splitext(path)[1].lower() == '.gif':
+        return GIFWriter
+    return FFmpegWriter
+
+
+def animation_writer(path, width, height, fps=10):
+    return writer_class(path)(path, width, height, fps)
@@ -0,0 +1,263 @@
+from __future__ import print_function
+
+"""
+
+Content-addressed cache of the results of the simulations
+
+The relaxed states, the initial (interpolated) bands and the files of the
+finished NEBM relaxations are saved in a local cache, under a key which is
+the hash of everything the result depends on: the lattice, the material
+parameters, the tolerances, the initial state (arrays or the code of the
+init_m functions), the interpolations, the spring constant, the stopping
+criterion, etc. Thus a simulation is only run again when one of these changes,
+e.g. not when a plotting option changes or after 'make clean'.
+
+Every entry is a folder in the cache directory (.artifact_cache next to this
+file by default, or the NEBM_CACHE_DIR environment variable) with the saved
+arrays or files. The total size of the cache is bounded (NEBM_CACHE_SIZE
+bytes, 2 GB by default): when an entry is saved, the least recently used
+entries are removed until the cache fits.
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+import hashlib
+import json
+import os
+import shutil
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           '.artifact_cache')
+DEFAULT_SIZE = 2 * 1024 ** 3
+
+# Change this when the results of the simulations change for the same
+# parameters, to invalidate the old entries
+CACHE_VERSION = 1
+
+
+def _update_hash(h, obj):
+    """
+    Add an object to a hash: arrays, numbers, strings, None, lists, tuples,
+    dictionaries and functions (by their code, constants, closure and
+    the simple global values they use)
+    """
+    if isinstance(obj, np.ndarray):
+        h.update('array{}{}'.format(obj.dtype.str, obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, (list, tuple)):
+        h.update('seq{}'.format(len(obj)).encode())
+        for item in obj:
+            _update_hash(h, item)
+    elif isinstance(obj, dict):
+        h.update('dict{}'.format(len(obj)).encode())
+        for key in sorted(obj):
+            _update_hash(h, key)
+            _update_hash(h, obj[key])
+    elif callable(obj) and hasattr(obj, '__code__'):
+        code = obj.__code__
+        h.update(b'function')
+        h.update(code.co_code)
+        _update_hash(h, [c for c in code.co_consts
+                         if not hasattr(c, 'co_code')])
+        _update_hash(h, [c.cell_contents for c in (obj.__closure__ or [])])
+        _update_hash(h, [obj.__globals__[name] for name in code.co_names
+                         if isinstance(obj.__globals__.get(name),
+                                       (int, float, str, tuple))])
+    elif isinstance(obj, np.number):
+        _update_hash(h, obj.item())
+    elif isinstance(obj, (bool, int, float, str)) or obj is None:
+        h.update('{}{!r}'.format(type(obj).__name__, obj).encode())
+    else:
+        raise TypeError('Cannot hash {!r} for the cache key'.format(obj))
+
+
+def artifact_key(*parts):
+    """
+    Hexadecimal key for a list of objects (see _update_hash)
+    """
+    h = hashlib.sha1()
+    _update_hash(h, [CACHE_VERSION] + list(parts))
+
+    return h.hexdigest()
+
+
+class ArtifactCache(object):
+    """
+    Size bounded cache of arrays and files, with least recently used
+    eviction
+
+    directory   :: Cache folder (NEBM_CACHE_DIR or .artifact_cache by
+                   default)
+
+    max_bytes   :: Maximum total size of the entries (NEBM_CACHE_SIZE or
+                   2 GB by default)
+
+    """
+
+    def __init__(self, directory=None, max_bytes=None):
+        self.directory = (directory or os.environ.get('NEBM_CACHE_DIR') or
+                          DEFAULT_DIR)
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('NEBM_CACHE_SIZE', DEFAULT_SIZE))
+        self.max_bytes = max_bytes
+
+    def key(self, *parts):
+        return artifact_key(*parts)
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def _get(self, key):
+        """
+        Folder of an entry, or None if it is not cached. The access time of
+        the entry is updated for the LRU eviction
+        """
+        entry = self._entry(key)
+        if not os.path.exists(os.path.join(entry, 'meta.json')):
+            return None
+        os.utime(entry, None)
+
+        return entry
+
+    def _put(self, key, write, **meta):
+        """
+        Create an entry calling write(folder) on a temporary folder which is
+        then renamed, so an entry is never read half written
+        """
+        entry = self._entry(key)
+        tmp = '{}.tmp{}'.format(entry, os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        write(tmp)
+        size = sum(os.path.getsize(os.path.join(d, f))
+                   for d, _, files in os.walk(tmp) for f in files)
+        meta['size'] = size
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        if os.path.exists(entry):
+            # Saved by another process
+            shutil.rmtree(tmp)
+        else:
+            os.rename(tmp, entry)
+        self.evict()
+
+    # Arrays ------------------------------------------------------------------
+
+    def load_arrays(self, key):
+        """
+        List with the arrays saved with the key, or None
+        """
+        entry = self._get(key)
+        if entry is None:
+            return None
+
+        with np.load(os.path.join(entry, 'arrays.npz')) as data:
+            return [data['arr_{}'.format(i)] for i in range(len(data.files))]
+
+    def save_arrays(self, key, arrays):
+        def write(folder):
+            np.savez(os.path.join(folder, 'arrays.npz'), *arrays)
+
+        self._put(key, write)
+
+    # Files -------------------------------------------------------------------
+
+    def restore_files(self, key, prefix=None):
+        """
+        Copy the files and folders saved with the key into the working
+        directory. If the files were saved with a prefix, the names starting
+        with it are renamed to start with 'prefix' (e.g. to restore the files
+        of a simulation with a different name). Returns False if the key is
+        not cached
+        """
+        entry = self._get(key)
+        if entry is None:
+            return False
+
+        with open(os.path.join(entry, 'meta.json')) as f:
+            cached_prefix = json.load(f).get('prefix')
+        if cached_prefix is None:
+            prefix = None
+
+        files = os.path.join(entry, 'files')
+        for directory, folders, names in os.walk(files):
+            for name in names:
+                src = os.path.join(directory, name)
+                dst = os.path.relpath(src, files)
+                if prefix is not None:
+                    dst = os.path.join(*[p.replace(cached_prefix, prefix, 1)
+                                         if p.startswith(cached_prefix)
+                                         else p for p in dst.split(os.sep)])
+                if os.path.dirname(dst) and not os.path.exists(
+                        os.path.dirname(dst)):
+                    os.makedirs(os.path.dirname(dst))
+                shutil.copy2(src, dst)
+
+        return True
+
+    def save_files(self, key, paths, prefix=None):
+        """
+        Save copies of files and folders (relative paths to the working
+        directory) with the key. The prefix of the names (e.g. the
+        simulation name) can be replaced when the files are restored
+        """
+        def write(folder):
+            for path in paths:
+                dst = os.path.join(folder, 'files', path)
+                if os.path.isdir(path):
+                    shutil.copytree(path, dst)
+                else:
+                    if not os.path.exists(os.path.dirname(dst)):
+                        os.makedirs(os.path.dirname(dst))
+                    shutil.copy2(path, dst)
+
+        self._put(key, write, prefix=prefix)
+
+    # LRU eviction ------------------------------------------------------------
+
+    def entries(self):
+        """
+        List of (access time, size, key) of the entries
+        """
+        entries = []
+        if not os.path.exists(self.directory):
+            return entries
+
+        for key in os.listdir(self.directory):
+            meta = os.path.join(self._entry(key), 'meta.json')
+            if '.tmp' in key or not os.path.exists(meta):
+                continue
+            with open(meta) as f:
+                size = json.load(f)['size']
+            entries.append((os.path.getmtime(self._entry(key)), size, key))
+
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the size of the cache
+        is smaller than max_bytes
+        """
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry(key), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    cache = ArtifactCache()
+    entries = cache.entries()
+    print('{}: {} entries, {:.1f} MB'.format(
+        cache.directory, len(entries),
+        sum(size for _, size, _ in entries) / 1024. ** 2))
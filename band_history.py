@@ -0,0 +1,202 @@
+"""
+
+Lazy access to the history of an NEBM simulation
+
+A BandHistory opens a simulation by its name and gives the magnetisation of
+the images of the saved bands, and the energies and distances of the images
+at every iteration, with [step, image] indexing:
+
+    history = BandHistory('neb_21x21-spins_fm-sk_atomic_k1e4')
+
+    history.m[2000, 5]          # Spins of the image 5 saved at the step 2000
+    history.m[-1, :]            # Array with the spins of the latest band
+    history.energies[-1, :]     # Energies (J) of the images, last iteration
+    history.energies[100:200, 3]
+    history.distances[-1, :]    # Distance of the images from the first one
+
+The step is the iteration number of the NEBM, or a negative index counting
+from the end (-1 for the latest band or iteration), and step slices select
+the iterations in [start, stop) (with their step as a stride of rows).
+
+Nothing is loaded when the history is opened. The spins are read from the
+band store (as a memory map) or the NPY folders of the simulation (see
+band_store.py), and the images recently used are kept in a small LRU cache,
+so moving through the images and steps of a band (e.g. with a slider in a
+notebook) only reads new images. The rows of the .ndt tables are read from
+their binary twins as memory maps when they are up to date, or with the
+row index of ndt_reader otherwise, so the tables are never parsed as a whole.
+
+"""
+
+from band_store import BandReader
+import ndt_reader
+
+# Numpy utilities
+import numpy as np
+
+from collections import OrderedDict
+import os
+
+
+class _Indexer(object):
+    """
+    Object with [step, image] indexing which calls a function of the step
+    and returns the image(s) of the result
+    """
+
+    def __init__(self, getter):
+        self._getter = getter
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        step, image = key
+
+        return self._getter(step, image)
+
+
+class BandHistory(object):
+    """
+    Lazy [step, image] access to the spins, energies and distances of an
+    NEBM simulation
+
+    simname     :: Simulation name
+
+    basedir     :: Folder with the saved bands
+
+    cache_size  :: Number of images kept in memory
+
+    """
+
+    def __init__(self, simname, basedir='npys', cache_size=64):
+        self.simname = simname
+        self.basedir = basedir
+        self.cache_size = cache_size
+
+        self._reader = None
+        self._cache = OrderedDict()
+        self._tables = {}
+
+        self.m = _Indexer(self._spins)
+        self.energies = _Indexer(self._energies)
+        self.distances = _Indexer(self._distances)
+
+    # Spins -------------------------------------------------------------------
+
+    @property
+    def reader(self):
+        if self._reader is None:
+            self._reader = BandReader(self.simname, self.basedir)
+        return self._reader
+
+    @property
+    def steps(self):
+        """
+        Steps of the saved bands
+        """
+        return self.reader.steps
+
+    @property
+    def n_images(self):
+        return self.reader.n_images
+
+    def image(self, step, i):
+        """
+        Spins of the i-th image of the band saved at the 'step' iteration
+        (negative steps count from the latest band), as a flat array as in
+        the NPY files
+        """
+        if step < 0:
+            step = self.steps[step]
+        key = (step, i)
+
+        if key in self._cache:
+            m = self._cache.pop(key)
+        else:
+            m = self.reader.image(step, i).reshape(-1)
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[key] = m
+
+        return m
+
+    def _spins(self, step, image):
+        if isinstance(image, slice):
+            return np.array([self.image(step, i)
+                             for i in range(self.n_images)[image]])
+        return self.image(step, image)
+
+    # Tables ------------------------------------------------------------------
+
+    def table_path(self, name):
+        return '{}_{}.ndt'.format(self.simname, name)
+
+    def _binary_table(self, name):
+        """
+        Memory map of the binary twin of a table, or None if it is not up to
+        date
+        """
+        path = self.table_path(name)
+        binary = path + '.npy'
+        mtime = os.path.getmtime(path)
+        if name not in self._tables or self._tables[name][0] != mtime:
+            table = None
+            if (os.path.exists(binary) and
+                    os.path.getmtime(binary) >= mtime):
+                table = ndt_reader.load(path)
+            self._tables[name] = (mtime, table)
+
+        return self._tables[name][1]
+
+    def table_steps(self, name='energy'):
+        """
+        Steps (iterations) in a table, e.g. 'energy' or 'dYs'
+        """
+        table = self._binary_table(name)
+        if table is not None:
+            return np.asarray(table[:, 0], dtype=int)
+        return ndt_reader.build_index(self.table_path(name))[:, 0]
+
+    def rows(self, name, step):
+        """
+        Rows of a table at an iteration (a single row) or a slice of
+        iterations, without the step column
+        """
+        path = self.table_path(name)
+        table = self._binary_table(name)
+
+        if isinstance(step, slice):
+            if table is not None:
+                a = (0 if step.start is None else
+                     np.searchsorted(table[:, 0], step.start))
+                b = (len(table) if step.stop is None else
+                     np.searchsorted(table[:, 0], step.stop))
+                rows = table[a:b]
+            else:
+                rows = ndt_reader.read_steps(path, step.start, step.stop)
+            return np.array(rows[::step.step, 1:])
+
+        if step < 0:
+            if table is not None:
+                return np.array(table[step, 1:])
+            return ndt_reader.tail(path, -step)[0, 1:]
+
+        if table is not None:
+            i = np.searchsorted(table[:, 0], step)
+            rows = table[i:i + 1]
+        else:
+            rows = ndt_reader.read_steps(path, step, step + 1)
+        if len(rows) == 0 or int(rows[0, 0]) != step:
+            raise KeyError('Step {} is not in {}'.format(step, path))
+
+        return np.array(rows[0, 1:])
+
+    def _energies(self, step, image):
+        return self.rows('energy', step)[..., image]
+
+    def _distances(self, step, image):
+        dYs = self.rows('dYs', step)
+        distances = np.zeros(dYs.shape[:-1] + (dYs.shape[-1] + 1,))
+        distances[..., 1:] = np.cumsum(dYs, axis=-1)
+
+        return distances[..., image]
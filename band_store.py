@@ -0,0 +1,496 @@
+from __future__ import print_function
+
+"""
+
+Single file storage for the history of an NEBM energy band
+
+Instead of a folder with a file for every image at every saved step, the
+bands are appended to a binary file
+
+    npys/<simname>_band.dat
+
+which is an array of shape (steps, images, spins, 3) and can be opened with
+np.memmap, so loading an image at a given step only reads that image from the
+disk. The data type, the shape of the bands and the saved steps are kept in
+the JSON header file
+
+    npys/<simname>_band.json
+
+which is rewritten when the store is flushed (flush() or close(), and every
+HEADER_INTERVAL seconds while the bands are appended), after the bands are
+written to the disk, thus a band is only part of the history when it was
+completely written. Rewriting the header for every band would take a time
+proportional to the number of saved steps at every append. A relaxation
+that is killed loses the bands of its last seconds at most, and a band of
+the latest saved step is not appended again (Fidimag saves the last step of
+a relaxation, which can also be a multiple of the saving steps).
+
+Bands can be stored in single precision (dtype=np.float32), which halves the
+size of the history of large lattices. The spins are always loaded as double
+precision arrays, renormalised when they were stored in a lower precision
+(see load_spins), thus the post-processing scripts read them as usual.
+
+Late in a relaxation consecutive bands differ only slightly, so a store can
+also be compressed (keyframe_every=K): every K-th band is saved in full (a
+keyframe) and the bands in between as the difference with the previous band,
+where the difference is the XOR of the bit patterns of the spins. The bits
+that did not change are zeros, which are compressed with zlib after grouping
+the bytes of the same significance of every number. The compression is
+lossless, and a band is rebuilt from its keyframe with at most K - 1
+differences (the last rebuilt band is kept, so reading the bands in order
+only applies one difference per band). The records of a compressed store
+have different sizes and their positions in the file are kept in the
+header, thus it cannot be opened with np.memmap.
+
+The folders of a simulation saved with the NPY files can be packed into a
+store from the command line:
+
+    python band_store.py neb_21x21-spins_fm-sk_atomic_k1e4
+
+or, compressed with a keyframe every 20 bands:
+
+    python band_store.py --keyframe-every 20 \
+        neb_21x21-spins_fm-sk_atomic_k1e4
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import json
+import os
+import time
+import zlib
+
+# zlib level of the compressed stores: the fastest level, since the bands
+# are compressed during the relaxation
+COMPRESSION_LEVEL = 1
+
+# Maximum time (s) between the writes of the header while appending bands
+HEADER_INTERVAL = 10.
+
+
+def load_spins(spins):
+    """
+    Double precision copy of a spin array (as in the NPY files), where the
+    spins are renormalised if the array has a lower precision
+    """
+    spins = np.asarray(spins)
+    if spins.dtype == np.float64:
+        return np.array(spins)
+
+    m = np.array(spins, dtype=np.float64).reshape(-1, 3)
+    norm = np.sqrt(np.sum(m ** 2, axis=1))
+    norm[norm == 0] = 1.
+
+    return (m / norm[:, np.newaxis]).reshape(spins.shape)
+
+
+def _bits(band):
+    """
+    View of an array as unsigned integers of the same size, to XOR the bit
+    patterns of two bands
+    """
+    return band.view('u{}'.format(band.dtype.itemsize))
+
+
+def _encode(bits):
+    """
+    Compressed bytes of an array of unsigned integers, where the bytes are
+    grouped by their significance (the same bytes of similar numbers are
+    usually equal)
+    """
+    shuffled = bits.reshape(-1).view(np.uint8).reshape(-1, bits.itemsize).T
+
+    return zlib.compress(np.ascontiguousarray(shuffled).tobytes(),
+                         COMPRESSION_LEVEL)
+
+
+def _decode(data, dtype, shape):
+    """
+    Array of unsigned integers (of the size of dtype) from _encode
+    """
+    dtype = np.dtype(dtype)
+    shuffled = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    bits = np.ascontiguousarray(shuffled.reshape(dtype.itemsize, -1).T)
+
+    return bits.view('u{}'.format(dtype.itemsize)).reshape(shape)
+
+
+class BandStore(object):
+    """
+    Append-only store of the bands of an NEBM simulation
+
+    simname     :: Simulation name
+
+    basedir     :: Folder where the store files are located
+
+    dtype       :: Data type of the stored spins (np.float64 for a new
+                   store). None to use the type of an existing store
+
+    keyframe_every
+                :: Compress the store, saving a full band every
+                   keyframe_every bands and the differences with the
+                   previous band in between (see the module docstring).
+                   None to use the compression of an existing store
+
+    The options of an existing store are read from its header. An empty
+    store (e.g. after truncate) takes the dtype and keyframe_every options
+    and the shape of the first appended band, and appending to a store
+    with other options raises a ValueError
+
+    """
+
+    def __init__(self, simname, basedir='npys', dtype=None,
+                 keyframe_every=None):
+        self.path = os.path.join(basedir, simname + '_band.dat')
+        self.header_path = os.path.join(basedir, simname + '_band.json')
+        self._options = (dtype, keyframe_every)
+
+        self.steps = []
+        if os.path.exists(self.header_path):
+            with open(self.header_path) as f:
+                header = json.load(f)
+            self.steps = header['steps']
+
+        if self.steps:
+            self.dtype = np.dtype(header['dtype'])
+            self.n_images = header['n_images']
+            self.n_spins = header['n_spins']
+            self.keyframe_every = header.get('keyframe_every')
+            self.offsets = header.get('offsets')
+        else:
+            self._reset()
+
+        self._memmap = None
+        # Latest rebuilt band of a compressed store, as (index, bits)
+        self._rebuilt = None
+        # Time of the last write of the header, and whether bands were
+        # appended after it
+        self._header_time = time.time()
+        self._unsaved = False
+
+    def _reset(self):
+        """
+        Options of an empty store, from the arguments of the store
+        """
+        dtype, keyframe_every = self._options
+        self.dtype = np.dtype(np.float64 if dtype is None else dtype)
+        self.n_images = None
+        self.n_spins = None
+        self.keyframe_every = keyframe_every
+        # Positions of the records of a compressed store in the file, with
+        # the end of the last record
+        self.offsets = [0] if keyframe_every else None
+
+    def _check_options(self):
+        """
+        Raise a ValueError if the store was opened with options different
+        from the ones of its stored bands
+        """
+        dtype, keyframe_every = self._options
+        if dtype is not None and np.dtype(dtype) != self.dtype:
+            raise ValueError('{} has bands of type {}, not {}'.format(
+                self.path, self.dtype, np.dtype(dtype)))
+        if (keyframe_every is not None and
+                keyframe_every != self.keyframe_every):
+            raise ValueError('{} has keyframe_every={}, not {}'.format(
+                self.path, self.keyframe_every, keyframe_every))
+
+    @staticmethod
+    def exists(simname, basedir='npys'):
+        return os.path.exists(os.path.join(basedir, simname + '_band.json'))
+
+    def __len__(self):
+        return len(self.steps)
+
+    @property
+    def compressed(self):
+        return bool(self.keyframe_every)
+
+    def _save_header(self):
+        header = {'dtype': self.dtype.str,
+                  'n_images': self.n_images,
+                  'n_spins': self.n_spins,
+                  'steps': self.steps}
+        if self.compressed:
+            header['keyframe_every'] = self.keyframe_every
+            header['offsets'] = self.offsets
+
+        tmp = self.header_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(header, f)
+        os.rename(tmp, self.header_path)
+
+    def _band_nbytes(self):
+        return self.n_images * self.n_spins * 3 * self.dtype.itemsize
+
+    def _size(self, n):
+        """
+        Size in bytes of the first n records of the history
+        """
+        if self.compressed:
+            return self.offsets[n]
+        return n * self._band_nbytes()
+
+    def _record(self, index):
+        """
+        Bytes of a band, or of its difference with the previous band, in a
+        compressed store
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(self.offsets[index])
+            return f.read(self.offsets[index + 1] - self.offsets[index])
+
+    def _rebuild(self, index):
+        """
+        Bit pattern of the band at the 'index' position of a compressed
+        store, from the closest keyframe or the latest rebuilt band
+        """
+        keyframe = index - index % self.keyframe_every
+        shape = (self.n_images, self.n_spins, 3)
+
+        if (self._rebuilt is not None and
+                keyframe <= self._rebuilt[0] <= index):
+            start, bits = self._rebuilt[0], np.copy(self._rebuilt[1])
+        else:
+            start = keyframe
+            bits = _decode(self._record(keyframe), self.dtype, shape)
+
+        for i in range(start + 1, index + 1):
+            bits ^= _decode(self._record(i), self.dtype, shape)
+
+        self._rebuilt = (index, bits)
+
+        return bits
+
+    def _band(self, index):
+        """
+        Stored band at the 'index' position, an array of shape
+        (images, spins, 3) in the dtype of the store
+        """
+        if self.compressed:
+            return np.copy(self._rebuild(index)).view(self.dtype)
+        return self.memmap()[index]
+
+    def _encode_band(self, band):
+        """
+        Record of a band appended to a compressed store
+        """
+        index = len(self.steps)
+        bits = _bits(band)
+        if index % self.keyframe_every == 0:
+            data = _encode(bits)
+        else:
+            data = _encode(bits ^ self._rebuild(index - 1))
+        self._rebuilt = (index, np.copy(bits))
+
+        return data
+
+    def append(self, step, band):
+        """
+        Append a band, an array with the images in its first axis, saved at
+        the 'step' iteration. A band of the latest saved step is skipped
+        """
+        if self.steps and int(step) == self.steps[-1]:
+            return
+
+        if self.steps:
+            self._check_options()
+        band = np.asarray(band, dtype=self.dtype).reshape(len(band), -1, 3)
+
+        if self.n_images is None:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self.n_images, self.n_spins = band.shape[:2]
+        elif band.shape[:2] != (self.n_images, self.n_spins):
+            raise ValueError('Band of shape {} does not match the store '
+                             'with {} images of {} spins'.format(
+                                 band.shape, self.n_images, self.n_spins))
+
+        band = np.ascontiguousarray(band)
+        if self.compressed:
+            data = self._encode_band(band)
+        else:
+            data = band.tobytes()
+
+        # Data written after the last band in the header is from an
+        # interrupted append, so we always write from the end of the history
+        with open(self.path, 'ab') as f:
+            f.truncate(self._size(len(self.steps)))
+            f.seek(0, os.SEEK_END)
+            f.write(data)
+
+        self.steps.append(int(step))
+        if self.compressed:
+            self.offsets.append(self.offsets[-1] + len(data))
+        self._unsaved = True
+        self._memmap = None
+
+        if time.time() - self._header_time > HEADER_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the appended bands to the disk and then the header with their
+        steps
+        """
+        if not self._unsaved:
+            return
+
+        with open(self.path, 'ab') as f:
+            os.fsync(f.fileno())
+        self._save_header()
+        self._header_time = time.time()
+        self._unsaved = False
+
+    def close(self):
+        self.flush()
+
+    def truncate(self, step):
+        """
+        Remove the bands saved after the 'step' iteration
+        """
+        n = len([s for s in self.steps if s <= step])
+        if n == len(self.steps):
+            return
+
+        self.steps = self.steps[:n]
+        if self.compressed:
+            self.offsets = self.offsets[:n + 1]
+        self._save_header()
+        self._unsaved = False
+        with open(self.path, 'ab') as f:
+            f.truncate(self._size(n))
+        if n == 0:
+            self._reset()
+        self._memmap = None
+        self._rebuilt = None
+
+    def memmap(self):
+        """
+        Read-only memory map of the history, with shape
+        (steps, images, spins, 3). Compressed stores cannot be memory mapped
+        (use band() and image())
+        """
+        if self.compressed:
+            raise ValueError('{} is a compressed store'.format(self.path))
+        if self._memmap is None:
+            self._memmap = np.memmap(self.path, dtype=self.dtype, mode='r',
+                                     shape=(len(self.steps), self.n_images,
+                                            self.n_spins, 3))
+        return self._memmap
+
+    def index(self, step):
+        """
+        Position in the history of the band saved at the 'step' iteration.
+        Negative steps count from the end of the history, i.e. -1 is the
+        latest band
+        """
+        if step < 0:
+            return len(self.steps) + step
+        return self.steps.index(step)
+
+    def image(self, step, i):
+        """
+        Copy of the spins of the i-th image, as a (spins, 3) array, of the
+        band saved at the 'step' iteration (-1 for the latest band)
+        """
+        if self.compressed:
+            return load_spins(self._band(self.index(step))[i])
+        return load_spins(self.memmap()[self.index(step), i])
+
+    def band(self, step):
+        """
+        List with the images of the band saved at the 'step' iteration (-1
+        for the latest band), as flat arrays as in the NPY files
+        """
+        data = load_spins(self._band(self.index(step)))
+        return [m.reshape(-1) for m in data]
+
+
+class BandReader(object):
+    """
+    Load the images of the saved bands of a simulation, from its single
+    file store if it exists, otherwise from the npys/<simname>_<step> folders
+
+    steps       :: Sorted list with the saved steps
+
+    n_images    :: Number of images of the bands
+
+    """
+
+    def __init__(self, simname, basedir='npys'):
+        import neb_checkpoint
+
+        if BandStore.exists(simname, basedir):
+            self.store = BandStore(simname, basedir)
+            self.steps = list(self.store.steps)
+            self.n_images = self.store.n_images
+        else:
+            self.store = None
+            self.folders = neb_checkpoint.band_folders(simname, basedir)
+            self.steps = sorted(self.folders)
+            self.n_images = 0
+            if self.steps:
+                self.n_images = len([f for f in os.listdir(
+                    self.folders[self.steps[-1]]) if f.startswith('image_')])
+
+    def image(self, step, i):
+        """
+        Spins of the i-th image of the band saved at the 'step' iteration
+        """
+        if self.store is not None:
+            return self.store.image(step, i)
+        return load_spins(np.load(os.path.join(self.folders[step],
+                                               'image_{:06}.npy'.format(i))))
+
+    def band(self, step):
+        """
+        Spins of the band saved at the 'step' iteration, as an array of
+        shape (images, spins, 3)
+        """
+        if self.store is not None:
+            return np.array(self.store.band(step)).reshape(self.n_images,
+                                                           -1, 3)
+        return np.array([self.image(step, i).reshape(-1, 3)
+                         for i in range(self.n_images)])
+
+
+def pack_folders(simname, basedir='npys', keyframe_every=None):
+    """
+    Append the bands from the npys/<simname>_<step> folders of a simulation
+    to its store, in order of the steps. Steps already in the store are
+    skipped. A new store is compressed if keyframe_every is specified
+    """
+    import neb_checkpoint
+
+    store = BandStore(simname, basedir, keyframe_every=keyframe_every)
+    folders = neb_checkpoint.band_folders(simname, basedir)
+    for step in sorted(folders):
+        if store.steps and step <= store.steps[-1]:
+            continue
+        files = sorted(f for f in os.listdir(folders[step])
+                       if f.startswith('image_'))
+        store.append(step, [np.load(os.path.join(folders[step], f))
+                            for f in files])
+    store.close()
+
+    return store
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the NPY folders of '
+                                     'simulations into band stores')
+    parser.add_argument('simnames', nargs='+')
+    parser.add_argument('--keyframe-every', type=int, default=None,
+                        help='Compress the stores, with a full band every '
+                        'KEYFRAME_EVERY bands')
+    args = parser.parse_args()
+
+    for simname in args.simnames:
+        store = pack_folders(simname, keyframe_every=args.keyframe_every)
+        print('{}: {} bands of {} images ({:.1f} MB)'.format(
+            store.path, len(store), store.n_images,
+            os.path.getsize(store.path) / 1024. ** 2))
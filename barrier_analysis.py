@@ -0,0 +1,272 @@
+from __future__ import print_function
+
+"""
+
+Energy barriers of every finished NEBM simulation in a directory tree
+
+The simulations are found by their <simname>_energy.ndt tables (the segments
+of restarted runs are skipped, see neb_checkpoint.py) and, for every one of
+them, the last rows of the energy and distance tables are read to compute:
+
+    barrier         :: Largest energy of the band relative to the first
+                       image (meV)
+    saddle_image    :: Image with the largest energy
+    saddle_distance :: Distance of the saddle image from the first image
+    path_length     :: Total (geodesic) length of the band
+    interp_barrier  :: Maximum of a cubic interpolation of the energy band,
+                       relative to the first image (meV)
+    interp_distance :: Position of the interpolated maximum
+
+The cubic interpolation uses the <simname>interpolation.dat file of the
+simulation when it exists (it is computed by Fidimag with the gradient of the
+energy), otherwise a piecewise cubic Hermite interpolation of the energies
+with the derivatives estimated from the neighbouring images.
+
+The results of every simulation are cached in <simname>_barrier.json, next to
+its tables, and they are only computed again when the tables change, so
+scanning a tree of thousands of runs again only reads the cache files. The
+results are saved in a single table:
+
+    python barrier_analysis.py sweep_DB -o barriers.txt
+
+"""
+
+import ndt_reader
+import neb_checkpoint
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import json
+import multiprocessing
+import os
+
+meV = 1e-3 * 1.602e-19
+
+TABLE_HEADER = ('run steps n_images barrier saddle_image saddle_distance '
+                'path_length interp_barrier interp_distance')
+
+# Folders with the band snapshots, which are not scanned
+SKIPPED_FOLDERS = ['npys', 'vtks']
+
+
+def find_runs(root):
+    """
+    List of (directory, simname) of the NEBM simulations in a directory tree
+    """
+    runs = []
+    for directory, folders, files in os.walk(root):
+        folders[:] = sorted(f for f in folders if f not in SKIPPED_FOLDERS)
+        for f in sorted(files):
+            if not f.endswith('_energy.ndt'):
+                continue
+            simname = f[:-len('_energy.ndt')]
+            # Restarted segments are folded into their simulation
+            if '-restart' in simname:
+                continue
+            if os.path.exists(os.path.join(directory, simname + '_dYs.ndt')):
+                runs.append((directory, simname))
+
+    return runs
+
+
+def is_finished(directory, simname):
+    """
+    False if the checkpoint of the simulation says it did not finish.
+    Simulations without a checkpoint are assumed to be finished
+    """
+    info = neb_checkpoint.load_checkpoint(os.path.join(directory, simname))
+
+    return info is None or info.get('finished', False)
+
+
+def run_files(directory, simname):
+    return [os.path.join(directory, simname + suffix)
+            for suffix in ['_energy.ndt', '_dYs.ndt', 'interpolation.dat']]
+
+
+def run_signature(directory, simname):
+    """
+    Size and modification time of the files the results are computed from
+    """
+    signature = []
+    for path in run_files(directory, simname):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append([os.path.basename(path), stat.st_size,
+                              stat.st_mtime])
+
+    return signature
+
+
+def cache_file(directory, simname):
+    return os.path.join(directory, simname + '_barrier.json')
+
+
+def load_cached(directory, simname):
+    """
+    Cached results of a simulation, or None if there are no results or the
+    tables changed after they were computed
+    """
+    path = cache_file(directory, simname)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+    except ValueError:
+        return None
+
+    if cache.get('signature') != run_signature(directory, simname):
+        return None
+
+    return cache['results']
+
+
+def hermite_maximum(distances, energies, n_points=50):
+    """
+    Maximum of the piecewise cubic Hermite interpolation of an energy band,
+    with the derivative at every interior image estimated from the parabola
+    through the image and its neighbours. The extremes of the band are
+    energy minima, thus their derivative is zero.
+
+    Returns the distance and the energy of the maximum
+    """
+    s = np.asarray(distances, dtype=np.float64)
+    E = np.asarray(energies, dtype=np.float64)
+
+    h = np.diff(s)
+    h[h <= 0] = np.finfo(np.float64).tiny
+    slopes = np.diff(E) / h
+
+    dE = np.zeros(len(E))
+    dE[1:-1] = ((h[1:] * slopes[:-1] + h[:-1] * slopes[1:]) /
+                (h[1:] + h[:-1]))
+
+    # Hermite basis evaluated on every segment at the same time,
+    # t has shape (1, n_points) and the segment arrays (segments, 1)
+    t = np.linspace(0, 1, n_points)[np.newaxis, :]
+    h00 = 2 * t ** 3 - 3 * t ** 2 + 1
+    h10 = t ** 3 - 2 * t ** 2 + t
+    h01 = -2 * t ** 3 + 3 * t ** 2
+    h11 = t ** 3 - t ** 2
+    hs = h[:, np.newaxis]
+    curve = (h00 * E[:-1, np.newaxis] + h10 * hs * dE[:-1, np.newaxis] +
+             h01 * E[1:, np.newaxis] + h11 * hs * dE[1:, np.newaxis])
+    positions = s[:-1, np.newaxis] + t * hs
+
+    i = np.argmax(curve)
+
+    return positions.flat[i], curve.flat[i]
+
+
+def analyse_run(args):
+    """
+    Compute the results of a simulation from the last rows of its tables and
+    save them in its cache file
+    """
+    directory, simname = args
+    energy_file, dYs_file, interp_file = run_files(directory, simname)
+    signature = run_signature(directory, simname)
+
+    # The first column is the step number
+    data_energy = ndt_reader.tail(energy_file)[-1]
+    data_dYs = ndt_reader.tail(dYs_file)[-1][1:]
+
+    energies = data_energy[1:]
+    distances = np.concatenate([[0.], np.cumsum(data_dYs)])
+    saddle = int(np.argmax(energies))
+
+    if os.path.exists(interp_file):
+        interp_data = np.loadtxt(interp_file)
+        i = np.argmax(interp_data[:, 1])
+        interp_distance, interp_energy = interp_data[i]
+        interp_energy -= interp_data[0, 1]
+    else:
+        interp_distance, interp_energy = hermite_maximum(distances,
+                                                         energies)
+        interp_energy -= energies[0]
+
+    results = {'steps': int(data_energy[0]),
+               'n_images': len(energies),
+               'barrier': (energies[saddle] - energies[0]) / meV,
+               'saddle_image': saddle,
+               'saddle_distance': distances[saddle],
+               'path_length': distances[-1],
+               'interp_barrier': interp_energy / meV,
+               'interp_distance': interp_distance}
+    results = dict((key, value.item() if hasattr(value, 'item') else value)
+                   for key, value in results.items())
+
+    path = cache_file(directory, simname)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'signature': signature, 'results': results}, f)
+    os.rename(path + '.tmp', path)
+
+    return directory, simname, results
+
+
+def analyse_tree(root, processes=None, finished_only=True, force=False):
+    """
+    Results of every simulation in a directory tree, as a list of
+    (run, results) sorted by the run path. Only the simulations without
+    valid cached results are analysed, in a pool of processes
+    """
+    runs = find_runs(root)
+    if finished_only:
+        runs = [r for r in runs if is_finished(*r)]
+
+    rows = []
+    pending = []
+    for directory, simname in runs:
+        cached = None if force else load_cached(directory, simname)
+        if cached is None:
+            pending.append((directory, simname))
+        else:
+            rows.append((directory, simname, cached))
+
+    print('{} simulations ({} cached)'.format(len(runs), len(rows)))
+
+    if len(pending) > 1 and processes != 1:
+        pool = multiprocessing.Pool(processes)
+        rows.extend(pool.imap_unordered(analyse_run, pending))
+        pool.close()
+        pool.join()
+    else:
+        rows.extend(analyse_run(r) for r in pending)
+
+    return sorted((os.path.relpath(os.path.join(directory, simname), root),
+                   results) for directory, simname, results in rows)
+
+
+def save_table(rows, path):
+    with open(path, 'w') as f:
+        f.write('# ' + TABLE_HEADER + '\n')
+        for run, r in rows:
+            f.write('{} {} {} {:.8f} {} {:.8e} {:.8e} {:.8f} {:.8e}\n'.format(
+                run, r['steps'], r['n_images'], r['barrier'],
+                r['saddle_image'], r['saddle_distance'], r['path_length'],
+                r['interp_barrier'], r['interp_distance']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Energy barriers of the '
+                                     'NEBM simulations in a directory tree')
+    parser.add_argument('root', nargs='?', default='.')
+    parser.add_argument('-o', '--output', default='barriers.txt')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--all', action='store_true',
+                        help='Include simulations that did not finish')
+    parser.add_argument('--force', action='store_true',
+                        help='Ignore the cached results')
+    args = parser.parse_args()
+
+    rows = analyse_tree(args.root, args.processes,
+                        finished_only=not args.all, force=args.force)
+    save_table(rows, args.output)
+
+    for run, r in rows:
+        print('{:<60} {:>12.4f} meV (image {})'.format(run, r['barrier'],
+                                                       r['saddle_image']))
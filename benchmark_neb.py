@@ -0,0 +1,247 @@
+from __future__ import print_function
+
+"""
+
+Benchmarks of the NEBM relaxation (relax_neb) of the sk-fm system
+
+For every combination of lattice size, number of images and spring constant
+we relax the band with relax_neb and measure:
+
+    iterations      :: Number of NEBM iterations
+    wall_time       :: Wall time of the relaxation (s)
+    it_per_s        :: Iterations per second
+    converge_time   :: Wall time until the largest dYdt of an iteration is
+                       first below stopping_dYdt (s), nan if it was not
+                       reached in max_iterations
+    peak_memory     :: Peak resident memory of the process (MB)
+
+Every benchmark runs in a new process, so the peak memory is not affected by
+the previous benchmarks, and the relaxed endpoints of every lattice size are
+saved in benchmarks/endpoints/ to be reused. The setup of the simulation is
+included in the wall time. The bands are only saved at the end and no VTK
+files are written, so the timings do not include the disk I/O of the
+snapshots. The results are written to
+timings.dat (a table) and benchmarks/results.json, which can be saved as the
+baseline and compared against it to catch regressions in the iterations per
+second:
+
+    python benchmark_neb.py --sizes 21 51 101 201 --save-baseline
+    python benchmark_neb.py --sizes 21 51 101 201 --compare
+
+"""
+
+from neb_relaxation import relax_neb, relax_state, init_m_fm, init_m_sk
+import ndt_reader
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import time
+
+BENCH_DIR = 'benchmarks'
+RESULTS_FILE = os.path.join(BENCH_DIR, 'results.json')
+BASELINE_FILE = os.path.join(BENCH_DIR, 'baseline.json')
+ENDPOINTS_DIR = os.path.abspath(os.path.join(BENCH_DIR, 'endpoints'))
+COLUMNS = ['nx', 'images', 'k', 'iterations', 'wall_time', 'it_per_s',
+           'converge_time', 'peak_memory']
+
+
+def benchmark_label(n, images, k):
+    return '{}x{}_im{}_k{:g}'.format(n, n, images, k)
+
+
+def endpoints(n):
+    """
+    Load or relax the skyrmion and ferromagnetic states of a lattice size
+    """
+    if not os.path.exists(ENDPOINTS_DIR):
+        os.makedirs(ENDPOINTS_DIR)
+
+    states = []
+    for state, init_m, tols in [('sk', init_m_sk(n, n), (1e-10, 1e-12)),
+                                ('fm', init_m_fm, None)]:
+        path = os.path.join(ENDPOINTS_DIR,
+                            '{}x{}_{}.npy'.format(n, n, state))
+        if not os.path.exists(path):
+            cwd = os.getcwd()
+            os.chdir(ENDPOINTS_DIR)
+            try:
+                np.save(path, relax_state(init_m, 'relax_{}'.format(state),
+                                          nx=n, ny=n, tols=tols))
+            finally:
+                os.chdir(cwd)
+        states.append(np.load(path))
+
+    return states
+
+
+class ConvergenceTimer(object):
+    """
+    Callback of the relaxation (see NEBM_Relaxation) recording the time when
+    dYdt drops below a threshold for the first time
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.time = None
+
+    def __call__(self, neb, dYdt):
+        if self.time is None and dYdt < self.threshold:
+            self.time = time.time()
+
+
+def run_benchmark(args):
+    """
+    Relax a band and return the measurements of the benchmark
+    """
+    n, images, k, max_iterations, stopping_dYdt = args
+    label = benchmark_label(n, images, k)
+
+    # The files of the simulations are saved in a temporary folder
+    folder = os.path.join(BENCH_DIR, 'runs', label)
+    if os.path.exists(folder):
+        shutil.rmtree(folder)
+    os.makedirs(folder)
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        init_im = endpoints(n)
+
+        timer = ConvergenceTimer(stopping_dYdt)
+        t0 = time.time()
+        relax_neb(k, max_iterations, label, init_im, [images - 2],
+                  save_every=max_iterations + 1, save_vtks=False,
+                  stopping_dYdt=stopping_dYdt,
+                  nx=n, ny=n, callbacks=[timer])
+        wall_time = time.time() - t0
+        iterations = int(ndt_reader.tail(label + '_energy.ndt')[-1][0])
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(folder)
+
+    # ru_maxrss is in kB in Linux and in bytes in OS X
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+    if sys.platform == 'darwin':
+        peak_memory /= 1024.
+
+    return {'nx': n, 'images': images, 'k': k,
+            'iterations': iterations,
+            'wall_time': wall_time,
+            'it_per_s': iterations / wall_time,
+            'converge_time': (float('nan') if timer.time is None
+                              else timer.time - t0),
+            'peak_memory': peak_memory}
+
+
+def run_benchmarks(sizes, images, ks, max_iterations=200, stopping_dYdt=0.01):
+    """
+    Run the benchmarks, one at a time, and return a dictionary with the
+    results of every benchmark label
+    """
+    results = {}
+    for n in sizes:
+        # The endpoints are relaxed in their own process, so their memory is
+        # not measured in the benchmarks
+        pool = multiprocessing.Pool(1)
+        pool.apply(endpoints, (n,))
+        pool.close()
+        pool.join()
+
+        for im in images:
+            for k in ks:
+                label = benchmark_label(n, im, k)
+                # A new process for every benchmark to measure its memory
+                pool = multiprocessing.Pool(1, maxtasksperchild=1)
+                results[label] = pool.apply(run_benchmark,
+                                            ((n, im, k, max_iterations,
+                                              stopping_dYdt),))
+                pool.close()
+                pool.join()
+                print('{:<24} {:8.2f} it/s  {:8.1f} MB'.format(
+                    label, results[label]['it_per_s'],
+                    results[label]['peak_memory']))
+
+    return results
+
+
+def save_results(results, path=RESULTS_FILE):
+    if not os.path.exists(BENCH_DIR):
+        os.makedirs(BENCH_DIR)
+
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=4, sort_keys=True)
+
+
+def save_timings(results, path='timings.dat'):
+    with open(path, 'w') as f:
+        f.write('# label ' + ' '.join(COLUMNS) + '\n')
+        for label in sorted(results):
+            f.write(label + ' ' + ' '.join('{:g}'.format(results[label][c])
+                                           for c in COLUMNS) + '\n')
+
+
+def compare(results, baseline, tolerance=0.1):
+    """
+    Compare the iterations per second against a baseline. Returns the list
+    of labels slower than the baseline by more than the tolerance (fraction)
+    """
+    regressions = []
+    print('\n{:<24} {:>12} {:>12} {:>8}'.format('Benchmark', 'Baseline',
+                                               'Current', 'Change'))
+    for label in sorted(results):
+        if label not in baseline:
+            continue
+        old = baseline[label]['it_per_s']
+        new = results[label]['it_per_s']
+        change = (new - old) / old
+        flag = ''
+        if change < -tolerance:
+            regressions.append(label)
+            flag = ' <-- REGRESSION'
+        print('{:<24} {:>12.2f} {:>12.2f} {:>7.1f}%{}'.format(
+            label, old, new, 100 * change, flag))
+
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='NEBM benchmarks')
+    parser.add_argument('--sizes', nargs='+', type=int,
+                        default=[21, 51, 101, 201])
+    parser.add_argument('--images', nargs='+', type=int, default=[18])
+    parser.add_argument('--k', nargs='+', type=float, default=[1e4])
+    parser.add_argument('--max_iterations', type=int, default=200)
+    parser.add_argument('--stopping_dYdt', type=float, default=0.01)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Allowed slowdown with respect to the baseline')
+    args = parser.parse_args()
+
+    # Checked before the benchmarks, which can take a long time
+    if (args.compare and not args.save_baseline and
+            not os.path.exists(BASELINE_FILE)):
+        print('No baseline in {}, the comparison is skipped (save one with '
+              '--save-baseline)'.format(BASELINE_FILE))
+        args.compare = False
+
+    results = run_benchmarks(args.sizes, args.images, args.k,
+                             args.max_iterations, args.stopping_dYdt)
+    save_results(results)
+    save_timings(results)
+
+    if args.save_baseline:
+        save_results(results, BASELINE_FILE)
+
+    if args.compare:
+        with open(BASELINE_FILE) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
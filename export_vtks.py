@@ -0,0 +1,116 @@
+from __future__ import print_function
+
+"""
+
+Export VTK files from the saved magnetisation arrays
+
+The simulations can be run without saving VTK files (save_vtks=False in
+relax_neb), which are larger than the NPY files and rarely used. With this
+script, the VTK files of a chosen range of steps and images are generated
+later, in a pool of processes, in the same folders the simulation would
+have used:
+
+    python export_vtks.py neb_21x21-spins_fm-sk_atomic_k1e4 --steps -1
+    python export_vtks.py neb_21x21-spins_fm-sk_atomic_k1e4 --first 0 \\
+        --last 1000 --images 8 9 10 11 12
+
+saves vtks/<simname>_<step>/image_XXXXXX.vtk from the npys folders or the
+band store of the simulation, and
+
+    python export_vtks.py --relaxation relaxation/relax_sk_21x21_npys
+
+saves a file for every m_<step>.npy file of a relaxation in the
+relaxation/relax_sk_21x21_vtks folder.
+
+"""
+
+from system_builder import generate_mesh
+from band_store import BandReader
+from snapshot_writer import save_band_vtks
+
+# Import physical constants from fidimag
+import fidimag.common.constant as const
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import multiprocessing
+import os
+
+
+def export_band(args):
+    """
+    Save the VTK files of a list of images of a saved band
+    """
+    simname, step, images, nx, ny, mu_s = args
+    mesh = generate_mesh(nx, ny)
+
+    reader = BandReader(simname)
+    # The images keep their number in the file names
+    directory = 'vtks/{}_{}'.format(simname, step)
+    save_band_vtks(mesh, np.ones(mesh.n) * mu_s * const.mu_B, directory,
+                   dict((i, reader.image(step, i)) for i in images))
+
+    return len(images)
+
+
+def export_relaxation(args):
+    """
+    Save the VTK file of a relaxation NPY file (m_<step>.npy)
+    """
+    npy, directory, nx, ny, mu_s = args
+    mesh = generate_mesh(nx, ny)
+
+    step = int(os.path.basename(npy)[2:-4])
+    save_band_vtks(mesh, np.ones(mesh.n) * mu_s * const.mu_B, directory,
+                   {step: np.load(npy)}, filename='m')
+
+    return 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export VTK files from '
+                                     'NPY files of the simulations')
+    parser.add_argument('simname', nargs='?')
+    parser.add_argument('--relaxation',
+                        help='Folder with the NPY files of a relaxation')
+    parser.add_argument('--steps', nargs='+', type=int,
+                        help='Saved steps (-1 for the last one)')
+    parser.add_argument('--first', type=int, default=None)
+    parser.add_argument('--last', type=int, default=None)
+    parser.add_argument('--images', nargs='+', type=int,
+                        help='Images to export (all by default)')
+    parser.add_argument('--nx', type=int, default=21)
+    parser.add_argument('--ny', type=int, default=21)
+    parser.add_argument('--mu_s', type=float, default=2.,
+                        help='Magnetic moment in Bohr magnetons')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.relaxation:
+        folder = args.relaxation.rstrip('/')
+        directory = folder[:-len('npys')] + 'vtks'
+        jobs = [(os.path.join(folder, f), directory, args.nx, args.ny,
+                 args.mu_s)
+                for f in os.listdir(folder) if f.startswith('m_')]
+        function = export_relaxation
+    else:
+        reader = BandReader(args.simname)
+        steps = reader.steps
+        if args.steps:
+            steps = [reader.steps[s] if s < 0 else s for s in args.steps]
+        steps = [s for s in steps
+                 if (args.first is None or s >= args.first) and
+                 (args.last is None or s <= args.last)]
+        images = args.images or list(range(reader.n_images))
+        jobs = [(args.simname, step, images, args.nx, args.ny, args.mu_s)
+                for step in steps]
+        function = export_band
+
+    pool = multiprocessing.Pool(args.processes)
+    n = sum(pool.imap_unordered(function, jobs))
+    pool.close()
+    pool.join()
+
+    print('{} VTK files saved'.format(n))
@@ -2,8 +2,18 @@
 
 Script to generate INC files for Povray
 
-We load 3 states: skyrmion, ferromagnetic, and sk destruction
-from the NEBM npys output folder (assumed 239 steps)
+By default we load 3 states: skyrmion, ferromagnetic, and sk destruction
+from the last step of the NEBM npys output (images 0, 17 and 11), and save
+them in skyrmion.inc, ferromagnetic.inc and destruction.inc
+
+With the --all option, or a list of --steps and --images, every image of the
+chosen saved steps is exported to
+
+    <outdir>/<simname>_<step>/image_XXXXXX.inc
+
+using a pool of processes, e.g. to render a movie of the whole NEBM history.
+The bands are read from the npys/<simname>_<step> folders or from the single
+file store of the simulation (see band_store.py)
 
 the .inc files include a row of data for every spin, with
 the sentence:
@@ -19,83 +29,119 @@ Contact to: d.i.cortes@soton.ac.uk
 
 """
 
-# FIDIMAG Simulation imports:
-from fidimag.atomistic import Sim
-from fidimag.common import CuboidMesh
-from os import listdir
-import re
-
-# Import physical constants from fidimag
-import fidimag.common.constant as const
-
+import argparse
+import multiprocessing
+import os
+import sys
 
 # Numpy utilities
 import numpy as np
 from matplotlib import cm
 
-mesh = CuboidMesh(nx=21, ny=21,
-                  dx=0.5, dy=0.5,
-                  unit_length=1e-9,
-                  periodicity=(True, True, False)
-                  )
+# Modules from the main folder of the repository
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', '..'))
+from system_builder import generate_mesh
+from band_store import BandReader
 
-# Initialise a simulation object and load the skyrmion
-# or ferromagnetic states
-sim = Sim(mesh, name='neb_21x21-spins_fm-sk_atomic')
+npys_folder = '../../npys'
 
-# Get the directories inside the npys folder from the NEBM simulation
-# and sort them by the last number (after the k magnitude)
-npys_folder = '../../npys/'
-files_list = listdir(npys_folder)
-files_list = sorted(files_list,
-                    key=lambda f: int(re.search(r'(?<=k1e4_)[0-9]+', f).group(0))
-                    )
 
-# Use the largest step from the files directory
-sk = npys_folder + files_list[-1] + '/image_000000.npy'
-fm = npys_folder + files_list[-1] + '/image_000017.npy'
-ds = npys_folder + files_list[-1] + '/image_000011.npy'
+def generate_inc_data(coordinates, spins):
+    """
+    Return the text of an INC file with the spins(...) sentence for every
+    spin, formatting all the rows at once
 
-states = {'skyrmion': sk, 'ferromagnetic': fm, 'destruction': ds}
+    coordinates :: (N, 3) array with the positions of the spins
 
-for key in states.keys():
-    sim.set_m(np.load(states[key]))
+    spins       :: Array with the spin orientations, as in the NPY files
 
-    # Append coordinates and spin orientations
-    data = np.append(np.array(sim.mesh.coordinates),
-                     sim.spin.reshape(-1, 3), axis=1)
+    """
+    spins = np.asarray(spins).reshape(-1, 3)
 
-    # Get the colormap using the last row, i.e. mz
+    # Get the colormap using mz
     # We must normalise it: [-1, 1]  --> [0, 1]
     # So we sum by 1 to shift the scale and divide by 1 - (-1) = 2
-    mz_rgb = cm.RdYlBu((data[:, -1] + 1) * 0.5)
-    # Remove last column with alpha values
-    mz_rgb = mz_rgb[:, :-1]
-
-    data = np.append(data, mz_rgb, axis=1)
-
-    # Open the output file
-    _file = open('{}.inc'.format(key), 'w')
-
-    # Now we write the spins(...) sentence for every spin
-    for row in data:
-        line = 'spins('
-        # We transform the axes according to POVRAY's coordinate
-        # system: x --> -z, y --> x, x --> y
-        line += '{},{},{},'.format(-row[2], row[1], row[0])
-        # The same for the spins orientations
-        # but somehow, Povray's left handed system gives the wrong directions
-        # if we do not correct the sign of the Y, Z components (?)
-        line += '{},{},{},'.format(-row[5], -row[4], -row[3])
-
-        # Now the colours
-        for num in row[6:]:
-            line += '{},'.format(num)
-
-        # Remove last comma and close brackets
-        line = line[:-1]
-        line += ')\n'
-
-        _file.write(line)
-
-    _file.close()
+    # and remove the last column with alpha values
+    mz_rgb = cm.RdYlBu((spins[:, 2] + 1) * 0.5)[:, :-1]
+
+    # We transform the axes according to POVRAY's coordinate
+    # system: x --> -z, y --> x, x --> y
+    # The same for the spins orientations
+    # but somehow, Povray's left handed system gives the wrong directions
+    # if we do not correct the sign of the Y, Z components (?)
+    data = np.column_stack((-coordinates[:, 2], coordinates[:, 1],
+                            coordinates[:, 0],
+                            -spins[:, 2], -spins[:, 1], -spins[:, 0],
+                            mz_rgb))
+
+    line = 'spins(' + ','.join(['%.6g'] * 9) + ')\n'
+
+    return (line * len(data)) % tuple(data.ravel())
+
+
+def write_inc(filename, coordinates, spins):
+    with open(filename, 'w') as f:
+        f.write(generate_inc_data(coordinates, spins))
+
+
+def export_step(args):
+    """
+    Write the INC files of a list of images of a saved step
+    """
+    simname, step, images, coordinates, outdir = args
+
+    reader = BandReader(simname, npys_folder)
+    folder = os.path.join(outdir, '{}_{}'.format(simname, step))
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    for i in images:
+        write_inc(os.path.join(folder, 'image_{:06}.inc'.format(i)),
+                  coordinates, reader.image(step, i))
+
+    return len(images)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='INC files for Povray '
+                                     'from the NEBM bands')
+    parser.add_argument('--simname',
+                        default='neb_21x21-spins_fm-sk_atomic_k1e4')
+    parser.add_argument('--all', action='store_true',
+                        help='Export every image of every saved step')
+    parser.add_argument('--steps', nargs='+', type=int,
+                        help='Saved steps to export (-1 for the last one)')
+    parser.add_argument('--images', nargs='+', type=int,
+                        help='Images to export (all by default)')
+    parser.add_argument('--nx', type=int, default=21)
+    parser.add_argument('--ny', type=int, default=21)
+    parser.add_argument('--outdir', default='incs')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    coordinates = np.array(generate_mesh(args.nx, args.ny).coordinates)
+    reader = BandReader(args.simname, npys_folder)
+
+    if not (args.all or args.steps or args.images):
+        # Use the largest step from the saved bands
+        states = {'skyrmion': 0, 'ferromagnetic': reader.n_images - 1,
+                  'destruction': 11}
+        for key in states.keys():
+            write_inc('{}.inc'.format(key), coordinates,
+                      reader.image(reader.steps[-1], states[key]))
+        sys.exit()
+
+    steps = reader.steps
+    if args.steps:
+        steps = [reader.steps[s] if s < 0 else s for s in args.steps]
+    images = args.images or list(range(reader.n_images))
+
+    pool = multiprocessing.Pool(args.processes)
+    n = sum(pool.imap_unordered(export_step,
+                                [(args.simname, step, images, coordinates,
+                                  args.outdir) for step in steps]))
+    pool.close()
+    pool.join()
+
+    print('{} INC files saved in {}'.format(n, args.outdir))
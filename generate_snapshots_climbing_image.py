@@ -1,9 +1,39 @@
 from __future__ import print_function
 
-import matplotlib.pyplot as plt
+"""
+
+Generate a snapshot of the energy band for every step of the Climbing Image
+NEBM simulation, which can be used to make an animation
+
+The number of frames and images are taken from the .ndt tables of the
+simulation. The frames are split in chunks which are rendered by a pool of
+processes, where every process creates the figure only once and updates the
+data and the text of its artists for every frame
+
+    python generate_snapshots_climbing_image.py [-p PROCESSES] [--every N]
+
+With the --output option, no PNG files are saved: the frames are rendered
+into RGB arrays and encoded by the processes, and the main process writes
+them in order to an animated GIF or to a video through ffmpeg (see
+animation_writer.py), e.g.
+
+    python generate_snapshots_climbing_image.py --output climbing_image.gif
+    python generate_snapshots_climbing_image.py --output climbing_image.mp4 \
+        --fps 25
+
+"""
+
 import matplotlib
-import numpy as np
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import argparse
+import multiprocessing
 import os
+import sys
+
+from band_history import BandHistory
+import animation_writer
+from system_options import script_options, simulation_name
 
 # Matplotlib tweaks -----------------------------------------------------------
 matplotlib.rcParams.update({'font.size': 22})
@@ -31,85 +61,218 @@ def modify_splines(ax, lwd=0.75, col='0.8'):
 x_scale = 1
 meV = 1e-3 * 1.602e-19
 
-# We load the last step. The first column is the step number, which
-# we get rid of in the dms file (dms are the differences between
-# images)
-data_energy = np.loadtxt('climbing_image_neb_21x21-spins_fm-sk_atomic_k1e4_energy.ndt')[:, 1:]
-data_dYs = np.loadtxt('climbing_image_neb_21x21-spins_fm-sk_atomic_k1e4_dYs.ndt')[:, 1:]
-
-# We will plot relatively to the skyrmion energy
-sk_energy = np.ones(len(data_energy[0])) * data_energy[0][0]
-
-# Scale the x axis (distances)
-data_dYs *= x_scale
-
-
-# Compute the total distance of a point from one of the extremes
-# (the extremes are energy minima). It is only necessary to
-# sum the distances up an specific point
-def compute_dYs(step):
-    dYs = [0]
-    for i in range(len(data_dYs[step])):
-        dYs.append(np.sum(data_dYs[step][:i + 1]))
-
-    return dYs
-
-# -----------------------------------------------------------------------------
-
-fig = plt.figure(figsize=(10, 6))
-ax = fig.add_subplot(111)
-
-# The label would show the total number of nebm steps
-ax.plot(compute_dYs(0), (data_energy[0] - sk_energy) / meV, 'ko-',
-        lw=2, ms=8,
-        # label=r'$k=10^{10}$ /' + ' {} Steps'.format(int(data1e10_energy[0]))
-        )
+# The simulation of the options of the pipeline (see system_options.py)
+options = script_options()
+simname = simulation_name('climbing_image_neb', options['nx'], options['ny'],
+                          images=options['images'],
+                          float32=options['float32'])
+folder = 'climbing_image_snaps/'
 
-# Decorations
-remove_ticks(ax)
-modify_splines(ax, lwd=0.75, col='0.9')
-remove_splines(ax, ['top', 'right'])
 
-ax.patch.set_facecolor('0.93')
-ax.grid(True, 'major', color='0.98', linestyle='-', linewidth=2.0)
-ax.set_axisbelow(True)
+def load_data():
+    """
+    Load all the iterations of the tables (from their binary copies when the
+    simulation saved them, see band_history.py)
 
+    Returns the step numbers, the energies relative to the skyrmion energy
+    (in meV) and the total distance of every image from the skyrmion
+    """
+    history = BandHistory(simname)
+    steps = history.table_steps('energy')
 
-ax.set_xlabel('Distance')
-ax.set_ylabel(r'Energy  [ ' + 'meV' + r' ]')
+    # We will plot relatively to the skyrmion energy
+    energies = history.energies[:, :]
+    energies = (energies - energies[0, 0]) / meV
 
-# plt.legend(loc='upper left')
+    # The total distance of a point from one of the extremes (the extremes
+    # are energy minima), scaling the x axis
+    distances = history.distances[:, :] * x_scale
 
-ax.set_ylim([-15, 44])
-ax.set_xlim([-1, 18])
+    return steps, energies, distances
 
 # -----------------------------------------------------------------------------
 
-folder = 'climbing_image_snaps/'
-if not os.path.exists(folder):
-    os.makedirs(folder)
-
-for i in range(66):
-
-    ax.texts = []
-    ax.lines[0].set_data(compute_dYs(i), (data_energy[i] - sk_energy) / meV)
-
-    # Annotate numbers extracting the position
-    # from the  plot curve and shift the y position a little
-    x, y = ax.lines[0].get_data()[0], ax.lines[0].get_data()[1]
-    for j in range(18):
-        ax.text(x[j], y[j] + 1.5,
-                '{}'.format(j),
-                fontsize=15,
-                horizontalalignment='center',
-                )
-
-    plt.text(0.05, 0.9,
-             'Step {:02}'.format(i),
-             horizontalalignment='left',
-             transform=ax.transAxes, fontsize=20
-             )
-
-    plt.savefig(folder + 'snapshot_{:06}.png'.format(i),
-                # dpi=500,
-                bbox_inches='tight')
+
+def generate_figure(n_images, xlim=(-1, 18), ylim=(-15, 44)):
+    """
+    Create the figure with the artists that are updated for every frame:
+    the band, the number of every image and the step. The default limits of
+    the axes are for the 21 x 21 spins system
+    """
+
+    fig = plt.figure(figsize=(10, 6))
+    ax = fig.add_subplot(111)
+
+    # The label would show the total number of nebm steps
+    band, = ax.plot([], [], 'ko-',
+                    lw=2, ms=8,
+                    # label=r'$k=10^{10}$ /' + ' {} Steps'.format(int(data1e10_energy[0]))
+                    )
+
+    # Decorations
+    remove_ticks(ax)
+    modify_splines(ax, lwd=0.75, col='0.9')
+    remove_splines(ax, ['top', 'right'])
+
+    ax.patch.set_facecolor('0.93')
+    ax.grid(True, 'major', color='0.98', linestyle='-', linewidth=2.0)
+    ax.set_axisbelow(True)
+
+    ax.set_xlabel('Distance')
+    ax.set_ylabel(r'Energy  [ ' + 'meV' + r' ]')
+
+    # plt.legend(loc='upper left')
+
+    ax.set_ylim(list(ylim))
+    ax.set_xlim(list(xlim))
+
+    # Annotate numbers at the images positions, which are shifted in
+    # the y direction a little
+    labels = [ax.text(0, 0,
+                      '{}'.format(j),
+                      fontsize=15,
+                      horizontalalignment='center',
+                      )
+              for j in range(n_images)]
+
+    step_label = ax.text(0.05, 0.9,
+                         '',
+                         horizontalalignment='left',
+                         transform=ax.transAxes, fontsize=20
+                         )
+
+    return fig, band, labels, step_label
+
+
+# Data shared by the frames of a process
+_frame_data = {}
+
+
+def init_worker(encode=None, fps=10):
+    """
+    Load the data and create the figure of a process. The 'encode' function
+    and the frame rate are used by encode_frames
+    """
+    _frame_data['encode'] = encode, fps
+    steps, energies, distances = load_data()
+    _frame_data['data'] = steps, energies, distances
+    limits = {}
+    # Other lattices have different barriers and path lengths, so the
+    # limits are fixed from the data of all the frames
+    if (options['nx'], options['ny']) != (21, 21):
+        limits = {'xlim': (-1, distances.max() + 1),
+                  'ylim': (energies.min() - 5, energies.max() + 5)}
+    _frame_data['figure'] = generate_figure(energies.shape[1], **limits)
+    if encode is not None:
+        # The frames of an animation have the size of the figure
+        _frame_data['figure'][0].tight_layout()
+
+
+def update_frame(i):
+    """
+    Update the artists of the figure of the process with the i-th frame
+    """
+    steps, energies, distances = _frame_data['data']
+    fig, band, labels, step_label = _frame_data['figure']
+
+    band.set_data(distances[i], energies[i])
+    for j, label in enumerate(labels):
+        label.set_position((distances[i][j], energies[i][j] + 1.5))
+    step_label.set_text('Step {:02}'.format(steps[i]))
+
+    return fig
+
+
+def render_frames(frames):
+    """
+    Save the snapshots of the frames in the list, updating the artists of
+    the figure of the process
+    """
+    for i in frames:
+        update_frame(i).savefig(folder + 'snapshot_{:06}.png'.format(i),
+                                # dpi=500,
+                                bbox_inches='tight')
+
+    return len(frames)
+
+
+def encode_frames(frames):
+    """
+    Render the frames in the list into RGB arrays and encode them for the
+    animation writer. Returns the size (height, width) of the frames and the
+    list with the encoded frames
+    """
+    encode, fps = _frame_data['encode']
+    encoded = []
+    for i in frames:
+        rgb = animation_writer.frame_rgb(update_frame(i))
+        encoded.append(encode(rgb, fps))
+
+    return rgb.shape[:2], encoded
+
+
+def save_animation(path, frames, processes, fps=10, chunk_size=8):
+    """
+    Encode the frames into an animation file, without intermediate files.
+    The frames are rendered in consecutive chunks by a pool of processes and
+    written in order
+    """
+    writer_class = animation_writer.writer_class(path)
+    chunks = [frames[i:i + chunk_size]
+              for i in range(0, len(frames), chunk_size)]
+
+    pool = multiprocessing.Pool(processes, initializer=init_worker,
+                                initargs=(writer_class.encode, fps))
+    writer = None
+    try:
+        for (height, width), encoded in pool.imap(encode_frames, chunks):
+            if writer is None:
+                writer = writer_class(path, width, height, fps)
+            for data in encoded:
+                writer.write(data)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        if writer is not None:
+            writer.close()
+
+    return len(frames)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Snapshots of the energy '
+                                     'band of the CI-NEBM simulation')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--every', type=int, default=1,
+                        help='Render one frame every N steps')
+    parser.add_argument('-o', '--output',
+                        help='Animation file (.gif or a video format of '
+                        'ffmpeg) instead of the PNG snapshots')
+    parser.add_argument('--fps', type=int, default=10,
+                        help='Frames per second of the animation')
+    args = parser.parse_args()
+
+    n_frames = len(BandHistory(simname).table_steps('energy'))
+    frames = list(range(0, n_frames, args.every))
+
+    if args.output:
+        n = save_animation(args.output, frames, args.processes, args.fps)
+        print('{} frames saved in {}'.format(n, args.output))
+        sys.exit(0)
+
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    # Interleaved chunks, so every process gets early and late frames
+    n_proc = args.processes or multiprocessing.cpu_count()
+    chunks = [frames[i::n_proc] for i in range(n_proc) if frames[i::n_proc]]
+
+    pool = multiprocessing.Pool(n_proc, initializer=init_worker)
+    n = sum(pool.map(render_frames, chunks))
+    pool.close()
+    pool.join()
+
+    print('{} snapshots saved in {}'.format(n, folder))
@@ -0,0 +1,322 @@
+from __future__ import print_function
+
+"""
+
+Harmonic transition state theory (HTST) for the skyrmion collapse
+
+The Arrhenius prefactor of the transition rate between two minima of the
+energy surface depends on the eigenvalues of the Hessian of the energy at the
+initial minimum and at the saddle point (the climbing image of a converged
+CI-NEBM band). Following Bessarab et al. [Phys. Rev. B 85, 184409 (2012)],
+the prefactor is
+
+                 1      ____________________    _______________
+    nu      =   ----   / prod_i eps_i^min      / sum_i a_i^2
+                2 pi  /  ------------------ * /  ----------
+                     V  prod_i' |eps_i^sp|   V      eps_i^sp
+
+where the eps are the eigenvalues of the Hessian in the tangent space of the
+spins (2 degrees of freedom per spin), the primed product excludes the
+negative eigenvalue at the saddle point, and the a_i are the projections of
+the precession of the mode i onto the unstable mode, which give the velocity
+of the system across the saddle point.
+
+The product of the Hessian with a vector in the tangent space is computed
+from the difference of the effective fields of the simulation at two
+displaced spin fields. By default the Hessian is built from 2N of these
+products and every eigenvalue is computed, so the ratio of the products is
+over the whole non-zero spectrum. For large lattices, where the Hessian does
+not fit in memory, only the 'n_modes' lowest eigenvalues can be found with an
+iterative block eigensolver (scipy's lobpcg), whose memory and time per
+product are proportional to the number of spins; this assumes that the
+higher modes of the minimum and the saddle point cancel in the ratio, thus
+the prefactor then depends on n_modes. Zero modes (translations of the
+skyrmion with PBCs) are excluded from the products, since their volume
+factors cancel when there is the same number of them at the minimum and at
+the saddle point. Otherwise the prefactor is NaN, with a warning.
+
+The prefactors of the sk -> fm and fm -> sk transitions of a finished
+simulation are computed from the command line:
+
+    python htst.py climbing_image_neb_21x21-spins_fm-sk_atomic_k1e4
+
+"""
+
+from system_builder import neb_sim
+from neb_relaxation import final_band
+import neb_checkpoint
+
+# Import physical constants from fidimag
+import fidimag.common.constant as const
+
+# Numpy utilities
+import numpy as np
+from scipy.sparse.linalg import LinearOperator, lobpcg
+
+import argparse
+import warnings
+
+
+def tangent_basis(spins):
+    """
+    Two orthonormal vectors perpendicular to every spin, as (N, 3) arrays
+    e1, e2 with e1 x e2 = m
+    """
+    m = np.asarray(spins, dtype=np.float64).reshape(-1, 3)
+
+    # Any vector not parallel to the spin, to start the basis
+    ref = np.zeros_like(m)
+    ref[:, 2] = 1.
+    parallel = np.abs(m[:, 2]) > 0.9
+    ref[parallel] = [1., 0., 0.]
+
+    e1 = np.cross(ref, m)
+    e1 /= np.sqrt(np.sum(e1 ** 2, axis=1))[:, np.newaxis]
+    e2 = np.cross(m, e1)
+
+    return e1, e2
+
+
+def energy_gradient(sim, spins):
+    """
+    Gradient of the energy with respect to the spins, from the effective
+    field of the simulation, as an (N, 3) array in J
+    """
+    # The spins are not normalised (as set_m would do) since the
+    # displacements along the tangent space are not unit vectors
+    sim.spin[:] = np.asarray(spins).reshape(-1)
+    sim.compute_effective_field(t=0)
+
+    return -sim._mu_s[:, np.newaxis] * sim.field.reshape(-1, 3)
+
+
+def tangent_hessian(sim, spins, eps=1e-4):
+    """
+    Matrix-free Hessian of the energy in the tangent space of a spin field,
+    as a scipy LinearOperator of size 2N x 2N acting on the components of
+    the displacements along the tangent_basis vectors. The Hessian in the
+    tangent space includes the curvature of the unit spheres:
+
+        H v = P (d^2 E / dm^2) v - (m . dE/dm) v
+
+    where P projects into the tangent space. The second derivatives of the
+    energy are computed with central differences of the gradient
+
+    Returns the operator and the tangent basis
+    """
+    m = np.asarray(spins, dtype=np.float64).reshape(-1, 3)
+    e1, e2 = tangent_basis(m)
+    n = len(m)
+
+    # Projection of the gradient on the spins, per spin
+    m_grad = np.sum(m * energy_gradient(sim, m), axis=1)[:, np.newaxis]
+
+    def matvec(v):
+        v = np.asarray(v).reshape(-1)
+        displacement = v[:n, np.newaxis] * e1 + v[n:, np.newaxis] * e2
+        hv = (energy_gradient(sim, m + eps * displacement) -
+              energy_gradient(sim, m - eps * displacement)) / (2 * eps)
+        hv -= m_grad * displacement
+
+        return np.concatenate([np.sum(hv * e1, axis=1),
+                               np.sum(hv * e2, axis=1)])
+
+    operator = LinearOperator((2 * n, 2 * n), matvec=matvec,
+                              dtype=np.float64)
+
+    return operator, (e1, e2)
+
+
+def all_modes(sim, spins):
+    """
+    Every eigenvalue (in J, in increasing order) of the Hessian in the
+    tangent space of a spin field, and the eigenvectors as the columns of a
+    (2N, 2N) array. The Hessian is built from 2N products of the operator of
+    tangent_hessian and symmetrised, since the products are computed with
+    finite differences
+    """
+    operator, basis = tangent_hessian(sim, spins)
+    n = operator.shape[0]
+
+    hessian = np.empty((n, n))
+    unit = np.zeros(n)
+    for j in range(n):
+        unit[j] = 1.
+        hessian[:, j] = operator.matvec(unit) / const.meV
+        unit[j] = 0.
+    eigenvalues, eigenvectors = np.linalg.eigh(0.5 * (hessian + hessian.T))
+
+    # The products of the operator change the spins, so we restore them
+    sim.set_m(np.asarray(spins).reshape(-1))
+
+    return eigenvalues * const.meV, eigenvectors
+
+
+def lowest_modes(sim, spins, n_modes=None, tol=1e-6, maxiter=2000,
+                 guard_modes=4):
+    """
+    The 'n_modes' lowest eigenvalues (in J) of the Hessian in the tangent
+    space of a spin field, and the eigenvectors as the columns of a
+    (2N, n_modes) array. If n_modes is None, every mode is computed (see
+    all_modes)
+
+    The eigenvalues are computed with the block method LOBPCG, which finds
+    degenerate modes (common in the symmetric states of this system) better
+    than Lanczos. The block has 'guard_modes' extra vectors to improve the
+    convergence of the highest requested modes, and 'tol' is the residual
+    tolerance in meV
+    """
+    if n_modes is None:
+        return all_modes(sim, spins)
+
+    operator, basis = tangent_hessian(sim, spins)
+    n = operator.shape[0]
+
+    # The operator in meV, so the tolerance does not depend on the units
+    scaled = LinearOperator((n, n), dtype=np.float64,
+                            matvec=lambda v: operator.matvec(v) / const.meV,
+                            matmat=lambda v: np.column_stack(
+                                [operator.matvec(c) / const.meV
+                                 for c in v.T]))
+    X = np.random.RandomState(42).randn(n, min(n_modes + guard_modes, n))
+    eigenvalues, eigenvectors = lobpcg(scaled, X, largest=False, tol=tol,
+                                       maxiter=maxiter)
+    order = np.argsort(eigenvalues)[:n_modes]
+    eigenvalues = eigenvalues * const.meV
+
+    # The products of the operator change the spins, so we restore them
+    sim.set_m(np.asarray(spins).reshape(-1))
+
+    return eigenvalues[order], eigenvectors[:, order]
+
+
+def precession_projections(sim, eigenvalues, eigenvectors):
+    """
+    Components a_i (in 1/s) along the first (unstable) mode of the saddle
+    point of the velocity of the linearised precession, for a unit
+    displacement along every mode i. The precession rotates the force on
+    every spin by 90 degrees around the spin: (u, v) -> (-v, u) in the
+    tangent basis
+    """
+    n = eigenvectors.shape[0] // 2
+    scale = (const.gamma / sim._mu_s)[:, np.newaxis]
+    u, v = eigenvectors[:n], eigenvectors[n:]
+
+    return eigenvalues * np.sum(scale * (u[:, :1] * -v + v[:, :1] * u),
+                                axis=0)
+
+
+def htst_prefactor(sim, minimum, saddle, n_modes=None, zero_tol=1e-6,
+                   saddle_modes=None):
+    """
+    Arrhenius prefactor (in 1/s) of the transition from a minimum through a
+    saddle point of the energy, computed from the eigenvalues of the Hessian
+    at both states (see the module docstring)
+
+    n_modes     :: Number of lowest eigenvalues, None for every eigenvalue.
+                   With a number of modes the prefactor depends on it
+
+    zero_tol    :: Eigenvalues with absolute values smaller than
+                   zero_tol times the largest computed eigenvalue are zero
+                   modes
+
+    saddle_modes:: Optional (eigenvalues, eigenvectors) of the saddle point
+                   from lowest_modes(), to reuse them for both directions
+                   of the transition
+
+    Returns a dictionary with the prefactor (NaN if the minimum and the
+    saddle point have a different number of zero modes) and the eigenvalues
+    (J)
+
+    """
+    eps_min, _ = lowest_modes(sim, minimum, n_modes)
+    if saddle_modes is None:
+        saddle_modes = lowest_modes(sim, saddle, n_modes)
+    eps_sp, modes_sp = saddle_modes
+
+    if eps_sp[0] >= 0:
+        raise ValueError('The saddle point has no negative eigenvalue, '
+                         'the band is probably not converged')
+
+    scale = max(np.abs(eps_min).max(), np.abs(eps_sp).max())
+    zero_min = np.abs(eps_min) < zero_tol * scale
+    zero_sp = np.abs(eps_sp) < zero_tol * scale
+    result = {'prefactor': np.nan,
+              'eigenvalues_min': eps_min,
+              'eigenvalues_saddle': eps_sp,
+              'zero_modes': int(zero_min.sum())}
+    if zero_min.sum() != zero_sp.sum():
+        warnings.warn('Different number of zero modes at the minimum ({}) '
+                      'and the saddle point ({}), the prefactor is '
+                      'undefined'.format(zero_min.sum(), zero_sp.sum()))
+        return result
+
+    # Stable, non-zero modes of the saddle point
+    stable = ~zero_sp
+    stable[0] = False
+    if np.any(eps_sp[stable] < 0):
+        raise ValueError('The saddle point has more than one negative '
+                         'eigenvalue')
+    a = precession_projections(sim, eps_sp, modes_sp)
+
+    # Products of the eigenvalues as sums of logarithms to avoid overflows
+    log_ratio = (np.sum(np.log(eps_min[~zero_min])) -
+                 np.sum(np.log(eps_sp[stable])))
+    dynamical = np.sum(a[stable] ** 2 / eps_sp[stable])
+    result['prefactor'] = np.sqrt(np.exp(log_ratio) * dynamical) / (2 * np.pi)
+
+    return result
+
+
+def saddle_image(simname, energies):
+    """
+    Climbing image of a simulation, or the image with the largest energy
+    """
+    info = neb_checkpoint.load_checkpoint(simname) or {}
+    climbing = info.get('climbing_image')
+    if isinstance(climbing, list) and climbing:
+        return climbing[0]
+    if isinstance(climbing, int):
+        return climbing
+
+    return int(np.argmax(energies))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='HTST prefactors of the '
+                                     'transitions of a CI-NEBM simulation')
+    parser.add_argument('simname')
+    parser.add_argument('--n_modes', type=int, default=None,
+                        help='Number of lowest modes, for lattices too '
+                        'large to compute every mode')
+    parser.add_argument('--J', type=float, default=10.)
+    parser.add_argument('--D', type=float, default=6.)
+    parser.add_argument('--B', type=float, default=25.)
+    parser.add_argument('--mu_s', type=float, default=2.)
+    parser.add_argument('--nx', type=int, default=21)
+    parser.add_argument('--ny', type=int, default=21)
+    args = parser.parse_args()
+
+    sim = neb_sim(args.J, args.D, args.B, args.mu_s, args.nx, args.ny)
+    band, energies = final_band(args.simname)
+    saddle = saddle_image(args.simname, energies)
+    meV = const.meV
+    saddle_modes = lowest_modes(sim, band[saddle], args.n_modes)
+
+    with open(args.simname + '_htst.txt', 'w') as f:
+        for label, image in [('forward', 0), ('backward', len(band) - 1)]:
+            result = htst_prefactor(sim, band[image], band[saddle],
+                                    args.n_modes, saddle_modes=saddle_modes)
+            barrier = (energies[saddle] - energies[image]) / meV
+            print('{}: barrier {:.4f} meV, prefactor {:.4e} 1/s '
+                  '({} zero modes)'.format(label, barrier,
+                                           result['prefactor'],
+                                           result['zero_modes']))
+            f.write('# {} image {} -> saddle image {}\n'.format(label, image,
+                                                              saddle))
+            f.write('# barrier (meV) prefactor (1/s)\n')
+            f.write('{:.8f} {:.8e}\n'.format(barrier, result['prefactor']))
+            f.write('# eigenvalues_min (meV) eigenvalues_saddle (meV)\n')
+            for e_min, e_sp in zip(result['eigenvalues_min'],
+                                   result['eigenvalues_saddle']):
+                f.write('{:.8e} {:.8e}\n'.format(e_min / meV, e_sp / meV))
@@ -0,0 +1,80 @@
+"""
+
+Coarse versions of the square lattice system, used to relax the states and
+the energy bands of large lattices in a few steps: a state is first relaxed
+on a lattice with 'factor' times fewer spins along every direction, and the
+result is interpolated into the original lattice as its initial state (see
+relax_state and relax_neb in neb_relaxation.py).
+
+The coarse lattice covers the same area as the original one, so the PBCs are
+kept, with a lattice constant 'factor' times larger (approximately, when the
+number of spins is not divisible by the factor). To describe the same
+continuum magnetisation, the parameters of the coarse system are scaled
+as:
+
+    J  -> J             the exchange energy does not depend on the lattice
+                        constant in two dimensions
+    D  -> D * f         the DMI energy density is D / a
+    mu_s -> mu_s * f^2  the Zeeman energy density is mu_s B / a^2
+
+where f is the ratio between the lattice constants.
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+
+def coarse_lattice(nx, ny, dx=0.5, dy=0.5, factor=2):
+    """
+    Number of spins and lattice constants of the coarse version of a
+    lattice. Returns (nx, ny, dx, dy)
+    """
+    cnx = max(int(round(nx / float(factor))), 1)
+    cny = max(int(round(ny / float(factor))), 1)
+
+    return cnx, cny, dx * nx / float(cnx), dy * ny / float(cny)
+
+
+def coarse_parameters(J, D, B, mu_s, nx, ny, dx=0.5, dy=0.5, factor=2):
+    """
+    Material parameters (J, D, B, mu_s) of the coarse version of a lattice
+    """
+    cnx, cny, cdx, cdy = coarse_lattice(nx, ny, dx, dy, factor)
+    fx, fy = cdx / dx, cdy / dy
+
+    return J, D * np.sqrt(fx * fy), B, mu_s * fx * fy
+
+
+def resample(spins, shape, new_shape):
+    """
+    Interpolate a spin field of a periodic lattice with shape = (nx, ny)
+    spins into a lattice of new_shape covering the same area. The spins are
+    bilinearly interpolated and normalised, thus coarsening by a factor of 2
+    averages blocks of 2 x 2 spins
+
+    spins       :: Array with the spin directions, as in the NPY files
+
+    Returns a flat array as in the NPY files
+    """
+    nx, ny = shape
+    new_nx, new_ny = new_shape
+    m = np.asarray(spins, dtype=np.float64).reshape(ny, nx, 3)
+
+    # Position of the new sites in units of the old lattice, which has its
+    # sites at the centre of the cells
+    x = (np.arange(new_nx) + 0.5) * nx / float(new_nx) - 0.5
+    y = (np.arange(new_ny) + 0.5) * ny / float(new_ny) - 0.5
+    x0, y0 = np.floor(x).astype(int), np.floor(y).astype(int)
+    wx = (x - x0)[np.newaxis, :, np.newaxis]
+    wy = (y - y0)[:, np.newaxis, np.newaxis]
+    x0, x1 = x0 % nx, (x0 + 1) % nx
+    y0, y1 = y0 % ny, (y0 + 1) % ny
+
+    new_m = ((1 - wy) * ((1 - wx) * m[y0][:, x0] + wx * m[y0][:, x1]) +
+             wy * ((1 - wx) * m[y1][:, x0] + wx * m[y1][:, x1]))
+
+    norm = np.sqrt(np.sum(new_m ** 2, axis=2))[:, :, np.newaxis]
+    norm[norm == 0] = 1.
+
+    return (new_m / norm).reshape(-1)
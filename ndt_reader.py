@@ -0,0 +1,179 @@
+from __future__ import print_function
+
+"""
+
+Fast access to the .ndt tables of the NEBM simulations
+
+The energy and distances tables (<simname>_energy.ndt, <simname>_dYs.ndt)
+get a row for every iteration of the NEBM, where the first column is the step
+number, thus parsing the whole table with np.loadtxt to get the last band is
+slow for long simulations. Here we have:
+
+    tail(path, n)           :: The last n rows, reading the file backwards
+                               from its end
+
+    iter_rows(path)         :: Generator with the rows of the table
+
+    read_steps(path, a, b)  :: Rows with steps in [a, b), using a sidecar
+                               index file with the byte offset of every row
+                               (<table>.idx.npy), which is updated
+                               incrementally when the table grows
+
+    load(path)              :: The whole table, from its binary twin
+                               (<table>.npy, see write_binary) when it is up
+                               to date
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+import os
+
+
+def _data_lines(lines):
+    return [line for line in lines
+            if line.strip() and not line.lstrip().startswith('#')]
+
+
+def _parse(lines):
+    """
+    Array with the rows from a list of lines without comments
+    """
+    if not lines:
+        return np.zeros((0, 0))
+
+    return np.array([line.split() for line in lines], dtype=np.float64)
+
+
+def tail(path, n=1, block_size=1 << 16):
+    """
+    Array with the last n rows of a table, reading blocks from the end of
+    the file until n complete rows are found
+    """
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        data = b''
+        # We need n + 1 line breaks to be sure the first row is complete
+        while position > 0 and data.count(b'\n') <= n:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            data = f.read(size) + data
+
+    lines = data.decode().splitlines()
+    # The first line can be incomplete if we did not reach the beginning
+    if position > 0:
+        lines = lines[1:]
+
+    return _parse(_data_lines(lines)[-n:])
+
+
+def iter_rows(path):
+    """
+    Generator with the rows of a table, as arrays
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                yield np.array(line.split(), dtype=np.float64)
+
+
+# Index -----------------------------------------------------------------------
+
+def _index_path(path):
+    return path + '.idx.npy'
+
+
+def build_index(path):
+    """
+    Return an array of shape (rows, 2) with the step and the byte offset of
+    every row of a table. The index is saved in a sidecar file and only the
+    rows appended since the last call are scanned
+    """
+    index = np.zeros((0, 2), dtype=np.int64)
+    if os.path.exists(_index_path(path)):
+        index = np.load(_index_path(path))
+
+    with open(path, 'rb') as f:
+        start = 0
+        if len(index):
+            # Check the table was not rewritten since the index was saved
+            f.seek(index[-1, 1])
+            line = f.readline()
+            if (line.endswith(b'\n') and line.split() and
+                    int(float(line.split()[0])) == index[-1, 0]):
+                start = f.tell()
+            else:
+                index = index[:0]
+
+        f.seek(start)
+        steps, offsets = [], []
+        offset = start
+        for line in iter(f.readline, b''):
+            # Incomplete last rows are indexed later
+            if not line.endswith(b'\n'):
+                break
+            if line.strip() and not line.startswith(b'#'):
+                steps.append(int(float(line.split()[0])))
+                offsets.append(offset)
+            offset += len(line)
+
+    if steps:
+        index = np.concatenate([index,
+                                np.array([steps, offsets],
+                                         dtype=np.int64).T])
+        np.save(_index_path(path), index)
+
+    return index
+
+
+def read_steps(path, start=None, stop=None):
+    """
+    Array with the rows of a table with steps in the range [start, stop)
+    """
+    index = build_index(path)
+    a = 0 if start is None else np.searchsorted(index[:, 0], start)
+    b = len(index) if stop is None else np.searchsorted(index[:, 0], stop)
+    if a >= b:
+        return np.zeros((0, 0))
+
+    with open(path, 'rb') as f:
+        f.seek(index[a, 1])
+        if b < len(index):
+            data = f.read(index[b, 1] - index[a, 1])
+        else:
+            data = f.read()
+
+    return _parse(_data_lines(data.decode().splitlines())[:b - a])
+
+# -----------------------------------------------------------------------------
+
+
+# Binary twin -----------------------------------------------------------------
+
+def _binary_path(path):
+    return path + '.npy'
+
+
+def write_binary(path):
+    """
+    Save the table as a NPY file next to it, which is used by load()
+    """
+    np.save(_binary_path(path), np.loadtxt(path, ndmin=2))
+
+
+def load(path, mmap_mode='r'):
+    """
+    Load a whole table. If the binary twin of the table is up to date, it is
+    loaded (as a memory map by default) instead of parsing the text
+    """
+    binary = _binary_path(path)
+    if (os.path.exists(binary) and
+            os.path.getmtime(binary) >= os.path.getmtime(path)):
+        return np.load(binary, mmap_mode=mmap_mode)
+
+    return np.loadtxt(path, ndmin=2)
+
+# -----------------------------------------------------------------------------
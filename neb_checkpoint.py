@@ -0,0 +1,185 @@
+from __future__ import print_function
+
+"""
+
+Checkpoint and restart utilities for the NEBM relaxations of relax_neb
+
+An NEBM simulation saves the band in npys/<simname>_<step>/ folders, with a
+file for every image, and the history of the energies and distances in the
+<simname>_energy.ndt and <simname>_dYs.ndt tables. A relaxation that is
+restarted from the latest saved band runs as a segment, named:
+
+    <simname>-restart<offset>
+
+where offset is the step of the band used as initial state. When the segment
+finishes (or when the next restart is attempted), its band folders and tables
+are folded back into the files of the original simulation, shifting the step
+numbers by the offset. Thus post-processing scripts only ever see the
+<simname> files.
+
+The state of the simulation (number of images, climbing image, spring
+constant and if the relaxation already finished) is kept in the
+<simname>_checkpoint.json file.
+
+Segments of simulations that save the bands in a single file store (see
+band_store.py) append their bands directly to the store of <simname>, with
+the step numbers shifted by the offset.
+
+"""
+
+from band_store import BandStore, load_spins
+
+# Numpy utilities
+import numpy as np
+
+import glob
+import json
+import os
+import re
+import shutil
+
+
+def segment_name(simname, offset):
+    return '{}-restart{:06}'.format(simname, offset)
+
+
+def checkpoint_file(simname):
+    return simname + '_checkpoint.json'
+
+
+def load_checkpoint(simname):
+    """
+    Dictionary with the state of the simulation, or None if there is no
+    checkpoint file
+    """
+    if not os.path.exists(checkpoint_file(simname)):
+        return None
+
+    with open(checkpoint_file(simname)) as f:
+        return json.load(f)
+
+
+def save_checkpoint(simname, **state):
+    info = load_checkpoint(simname) or {}
+    info.update(state)
+
+    # Write and rename so an interruption never leaves a broken file
+    tmp = checkpoint_file(simname) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(info, f, indent=4, sort_keys=True)
+    os.rename(tmp, checkpoint_file(simname))
+
+
+def band_folders(simname, basedir='npys'):
+    """
+    Dictionary {step: folder} with the band folders of a simulation
+    """
+    folders = {}
+    for folder in glob.glob(os.path.join(basedir, simname + '_*')):
+        step = re.match(r'_(\d+)$', folder[len(os.path.join(basedir,
+                                                            simname)):])
+        if step is not None:
+            folders[int(step.group(1))] = folder
+
+    return folders
+
+
+def load_band(folder, n_images):
+    """
+    Load the images of a band folder. None is returned if the folder is not
+    complete, e.g. when the simulation was interrupted while saving it
+    """
+    try:
+        return [load_spins(np.load(os.path.join(
+                    folder, 'image_{:06}.npy'.format(i))))
+                for i in range(n_images)]
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def latest_band(simname, n_images):
+    """
+    Return the step and the images of the latest complete band of a
+    simulation, or (None, None) if no band was saved. Simulations saving the
+    bands in a single file (see band_store.py) are restarted from the store
+    """
+    if BandStore.exists(simname):
+        store = BandStore(simname)
+        if len(store):
+            return store.steps[-1], store.band(-1)
+        return None, None
+
+    folders = band_folders(simname)
+    for step in sorted(folders, reverse=True):
+        band = load_band(folders[step], n_images)
+        if band is not None:
+            return step, band
+
+    return None, None
+
+
+def _fold_table(table, segment_table, offset):
+    """
+    Append the rows of a segment .ndt table to the table of the simulation,
+    removing the rows of the simulation after the offset step. The first
+    column of the tables is the step number
+    """
+    header, rows = [], []
+    if os.path.exists(table):
+        with open(table) as f:
+            for line in f:
+                if line.startswith('#'):
+                    header.append(line)
+                elif line.strip() and float(line.split()[0]) <= offset:
+                    rows.append(line)
+
+    with open(segment_table) as f:
+        for line in f:
+            if line.startswith('#'):
+                if not os.path.exists(table):
+                    header.append(line)
+            elif line.strip():
+                step, data = line.split(None, 1)
+                step = int(float(step)) + offset
+                if step > offset:
+                    rows.append('{} {}'.format(step, data))
+
+    tmp = table + '.tmp'
+    with open(tmp, 'w') as f:
+        f.writelines(header + rows)
+    os.rename(tmp, table)
+    os.remove(segment_table)
+
+
+def fold_segments(simname):
+    """
+    Move the band folders and the tables of the restarted segments of a
+    simulation into the files of the simulation, in order of the offsets
+    """
+    segments = {}
+    for ndt in glob.glob(simname + '-restart*_energy.ndt'):
+        offset = re.search(r'-restart(\d+)_energy\.ndt$', ndt)
+        if offset is not None:
+            segments[int(offset.group(1))] = ndt[:-len('_energy.ndt')]
+
+    for offset in sorted(segments):
+        segname = segments[offset]
+
+        # Bands saved after the offset are from the interrupted run, and the
+        # step 0 of a segment is the band the segment started from
+        for basedir in ['npys', 'vtks']:
+            for step, folder in band_folders(simname, basedir).items():
+                if step > offset:
+                    shutil.rmtree(folder)
+
+            for step, folder in band_folders(segname, basedir).items():
+                target = os.path.join(basedir,
+                                      '{}_{}'.format(simname, step + offset))
+                if step == 0:
+                    shutil.rmtree(folder)
+                else:
+                    os.rename(folder, target)
+
+        for segment_table in glob.glob(segname + '_*.ndt'):
+            table = simname + segment_table[len(segname):]
+            _fold_table(table, segment_table, offset)
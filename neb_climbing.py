@@ -0,0 +1,84 @@
+"""
+
+Automatic activation of the Climbing Image NEBM
+
+Instead of relaxing a band, looking for the image with the largest energy and
+then relaxing the band again with that image as climbing image, the
+AutoClimbing callback of an NEBM_Relaxation (see neb_relaxation.py) makes the
+images at the saddle points climb once the band has partly converged, i.e.
+when the largest dYdt of the band is smaller than a threshold.
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+
+def find_saddles(energies, min_fraction=0.1):
+    """
+    Return a list with the indexes of the images at the maxima of the energy
+    band (excluding the extremes), sorted from the largest energy. Maxima
+    whose energy drop to the minima between them and their neighbouring
+    maxima (or the extremes) is smaller than 'min_fraction' times the energy
+    barrier are ignored, since they are usually noise of the band
+    """
+    E = np.asarray(energies, dtype=np.float64)
+    n = len(E)
+    barrier = E[1:-1].max() - max(E[0], E[-1])
+
+    maxima = [i for i in range(1, n - 1)
+              if E[i] >= E[i - 1] and E[i] > E[i + 1]]
+    bounds = [0] + maxima + [n - 1]
+    saddles = []
+    for j, i in enumerate(maxima):
+        drop = E[i] - max(E[bounds[j]:i + 1].min(),
+                          E[i:bounds[j + 2] + 1].min())
+        if drop >= min_fraction * barrier:
+            saddles.append(i)
+
+    if not saddles:
+        saddles = [1 + int(np.argmax(E[1:-1]))]
+
+    return sorted(saddles, key=lambda i: -E[i])
+
+
+class AutoClimbing(object):
+    """
+    Callback activating the climbing images of an NEBM_Relaxation
+
+    climbing_dYdt   :: The climbing images are chosen when the largest dYdt
+                       of the band is smaller than this value, which must be
+                       larger than the stopping_dYdt of the relaxation
+
+    multiple        :: If True, every saddle point of the band gets a
+                       climbing image, otherwise only the largest one
+
+    on_activation   :: Optional function called with the list of climbing
+                       images, e.g. to save them in the checkpoint
+
+    """
+
+    def __init__(self, climbing_dYdt, multiple=False, on_activation=None):
+        self.climbing_dYdt = climbing_dYdt
+        self.multiple = multiple
+        self.on_activation = on_activation
+        self.images = None
+
+    def __call__(self, neb, dYdt):
+        if self.images is not None or dYdt is None:
+            return None
+        if dYdt >= self.climbing_dYdt:
+            return None
+
+        saddles = find_saddles(neb.energies)
+        self.images = saddles if self.multiple else saddles[:1]
+        neb.set_climbing_image(self.images)
+        print('Climbing images: {} (iteration {})'.format(
+            self.images, getattr(neb, 'iterations', '')))
+
+        if self.on_activation is not None:
+            self.on_activation(self.images)
+
+        # The band changes with the climbing images, thus it is not
+        # converged in this iteration
+        return self.climbing_dYdt
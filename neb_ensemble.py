@@ -0,0 +1,510 @@
+from __future__ import print_function
+
+"""
+
+Ensemble of NEBM relaxations from different initial paths
+
+A band relaxed with the NEBM converges to the minimum energy path closest to
+its initial path, thus starting always from the geodesic interpolation
+between the skyrmion and the ferromagnetic state can miss competing
+mechanisms of the skyrmion annihilation. Here we generate an ensemble of
+initial bands of different kinds:
+
+    geodesic    :: Rotation of every spin along its geodesic (the usual
+                   interpolation of the NEBM)
+
+    collapse    :: The skyrmion shrinks at its position, with the profile of
+                   the relaxed skyrmion scaled by a decreasing radius
+
+    drift<a>    :: The skyrmion shrinks while its core moves a distance
+                   'drift' in the direction of a degrees. With the PBCs of
+                   the sample the skyrmion cannot escape through a
+                   boundary, so these paths explore the collapse at
+                   different positions of the sample
+
+    <kind>_noise<j>
+                :: Copies of the geodesic and collapse paths with random
+                   noise on the spins of the intermediate images
+
+The bands are relaxed in a process pool, every one in its own folder of the
+output directory, and a row with the energy barrier (meV), the saddle image,
+the number of iterations and the wall time is appended to the index
+(ensemble_index.txt) when a band finishes. Finished bands are skipped, so an
+interrupted ensemble is resumed by running the same command again.
+
+The relaxed bands are grouped into distinct paths: two bands belong to the
+same path when the mean angle between the spins of their images, with the
+skyrmion of every image moved to the centre of the lattice, is smaller than a
+tolerance, so a mechanism found at different positions of the periodic sample
+is a single path. The paths, sorted by their energy barrier, are saved in
+ensemble_paths.txt. Example:
+
+    python neb_ensemble.py --drifts 6 --noisy 3 -o ensemble
+
+"""
+
+from neb_relaxation import relax_neb, final_band, latest_npy
+from skyrmion_observables import skyrmion_observables
+from system_options import relaxation_name
+import ndt_reader
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import multiprocessing
+import os
+import time
+
+meV = 1e-3 * 1.602e-19
+
+INDEX_FILE = 'ensemble_index.txt'
+INDEX_HEADER = 'label barrier saddle_image iterations wall_time'
+
+PATHS_FILE = 'ensemble_paths.txt'
+PATHS_HEADER = 'path label barrier saddle_image n_bands bands'
+
+
+# Initial bands ---------------------------------------------------------------
+
+def rotate_spins(m_a, m_b, t):
+    """
+    Rotate the spins m_a (arrays of shape (N, 3)) a fraction t of the angle
+    to the spins m_b, along their geodesics. Antiparallel spins are rotated
+    around an axis perpendicular to them
+    """
+    axis = np.cross(m_a, m_b)
+    norm = np.sqrt(np.sum(axis ** 2, axis=1))
+    undefined = norm < 1e-8
+    if np.any(undefined):
+        ref = np.zeros((undefined.sum(), 3))
+        ref[:, 0] = 1.
+        ref[np.abs(m_a[undefined, 0]) > 0.9] = [0., 1., 0.]
+        axis[undefined] = np.cross(m_a[undefined], ref)
+        norm[undefined] = np.sqrt(np.sum(axis[undefined] ** 2, axis=1))
+    axis /= norm[:, np.newaxis]
+
+    angle = t * np.arccos(np.clip(np.sum(m_a * m_b, axis=1), -1., 1.))
+    angle = angle[:, np.newaxis]
+
+    return m_a * np.cos(angle) + np.cross(axis, m_a) * np.sin(angle)
+
+
+def geodesic_band(m_a, m_b, n_images):
+    """
+    Band of n_images with the spins rotated along their geodesics from the
+    state m_a to m_b (flat arrays as in the NPY files)
+    """
+    m_a = np.asarray(m_a).reshape(-1, 3)
+    m_b = np.asarray(m_b).reshape(-1, 3)
+
+    return [rotate_spins(m_a, m_b, t).reshape(-1)
+            for t in np.linspace(0, 1, n_images)]
+
+
+def skyrmion_profile(m, nx, ny, dx=0.5, dy=0.5, n_bins=50):
+    """
+    Description of a relaxed skyrmion: a dictionary with the core position,
+    the direction of the background, the helicity and the radial profile of
+    the polar angle of the spins with respect to the background
+    """
+    m = np.asarray(m, dtype=np.float64).reshape(ny, nx, 3)
+    observables = skyrmion_observables(m, dx, dy)
+    centre = np.array([observables['core_x'], observables['core_y']])
+    background = 1. if np.median(m[..., 2]) >= 0 else -1.
+
+    r, phi = _polar_coordinates(centre, nx, ny, dx, dy)
+    theta = np.arccos(np.clip(background * m[..., 2], -1., 1.))
+
+    # Angle between the in-plane spins and the radial direction
+    helicity = np.angle(np.sum((m[..., 0] + 1j * m[..., 1]) *
+                               np.exp(-1j * phi)))
+
+    # Radial average of the polar angle
+    bins = np.linspace(0, r.max(), n_bins + 1)
+    index = np.clip(np.digitize(r.reshape(-1), bins) - 1, 0, n_bins - 1)
+    counts = np.bincount(index, minlength=n_bins)
+    sums = np.bincount(index, weights=theta.reshape(-1), minlength=n_bins)
+    filled = counts > 0
+    r_profile = (0.5 * (bins[1:] + bins[:-1]))[filled]
+    theta_profile = sums[filled] / counts[filled]
+
+    return {'centre': centre, 'background': background,
+            'helicity': helicity, 'r': r_profile, 'theta': theta_profile}
+
+
+def _polar_coordinates(centre, nx, ny, dx, dy):
+    """
+    Distances and angles of the lattice sites with respect to a position,
+    with the shortest vectors of the periodic lattice
+    """
+    x = (np.arange(nx) + 0.5) * dx
+    y = (np.arange(ny) + 0.5) * dy
+    X, Y = np.meshgrid(x, y)
+    Lx, Ly = nx * dx, ny * dy
+    X = (X - centre[0] + 0.5 * Lx) % Lx - 0.5 * Lx
+    Y = (Y - centre[1] + 0.5 * Ly) % Ly - 0.5 * Ly
+
+    return np.sqrt(X ** 2 + Y ** 2), np.arctan2(Y, X)
+
+
+def skyrmion_state(profile, centre, scale, nx, ny, dx=0.5, dy=0.5):
+    """
+    Spins of a skyrmion with the profile of skyrmion_profile() with its
+    radius scaled by 'scale' and its core at 'centre'. A flat array as in
+    the NPY files
+    """
+    r, phi = _polar_coordinates(centre, nx, ny, dx, dy)
+    if scale > 0:
+        theta = np.interp(r / scale, profile['r'], profile['theta'],
+                          right=0.)
+    else:
+        theta = np.zeros_like(r)
+
+    psi = phi + profile['helicity']
+    m = np.stack([np.sin(theta) * np.cos(psi),
+                  np.sin(theta) * np.sin(psi),
+                  profile['background'] * np.cos(theta)], axis=-1)
+
+    return m.reshape(-1)
+
+
+def collapse_band(m_sk, m_fm, n_images, nx, ny, dx=0.5, dy=0.5,
+                  shift=(0., 0.)):
+    """
+    Band where the skyrmion shrinks linearly with the image number, while
+    its core moves by 'shift' (nm). The extremes are the given states
+    """
+    profile = skyrmion_profile(m_sk, nx, ny, dx, dy)
+    band = [np.asarray(m_sk).reshape(-1)]
+    for t in np.linspace(0, 1, n_images)[1:-1]:
+        band.append(skyrmion_state(profile,
+                                   profile['centre'] + t * np.asarray(shift),
+                                   1 - t, nx, ny, dx, dy))
+    band.append(np.asarray(m_fm).reshape(-1))
+
+    return band
+
+
+def add_noise(band, amplitude, rng):
+    """
+    Copy of a band with Gaussian noise of the given amplitude added to the
+    spins of the intermediate images
+    """
+    noisy = [np.copy(band[0])]
+    for m in band[1:-1]:
+        m = np.reshape(m, (-1, 3)) + amplitude * rng.randn(len(m) // 3, 3)
+        m /= np.sqrt(np.sum(m ** 2, axis=1))[:, np.newaxis]
+        noisy.append(m.reshape(-1))
+    noisy.append(np.copy(band[-1]))
+
+    return noisy
+
+
+def ensemble_bands(m_sk, m_fm, n_images, nx, ny, dx=0.5, dy=0.5,
+                   drifts=4, drift=None, noisy=2, noise=0.2, seed=42):
+    """
+    Initial bands of the ensemble (see the module docstring), as a list of
+    (label, band) tuples
+
+    drifts      :: Number of drift paths, with equally spaced directions
+
+    drift       :: Distance moved by the core in the drift paths, in nm. A
+                   quarter of the sample size by default
+
+    noisy       :: Number of noisy copies of the geodesic and collapse paths
+
+    noise       :: Amplitude of the noise on the spin components
+
+    """
+    if drift is None:
+        drift = 0.25 * min(nx * dx, ny * dy)
+
+    bands = [('geodesic', geodesic_band(m_sk, m_fm, n_images)),
+             ('collapse', collapse_band(m_sk, m_fm, n_images,
+                                        nx, ny, dx, dy))]
+    for angle in np.arange(drifts) * 360. / max(drifts, 1):
+        shift = drift * np.array([np.cos(np.radians(angle)),
+                                  np.sin(np.radians(angle))])
+        bands.append(('drift{:03.0f}'.format(angle),
+                      collapse_band(m_sk, m_fm, n_images, nx, ny, dx, dy,
+                                    shift)))
+
+    rng = np.random.RandomState(seed)
+    for label, band in bands[:2]:
+        for j in range(noisy):
+            bands.append(('{}_noise{}'.format(label, j),
+                          add_noise(band, noise, rng)))
+
+    return bands
+
+# -----------------------------------------------------------------------------
+
+
+# Distinct paths --------------------------------------------------------------
+
+def align_band(band, nx, ny, dx=0.5, dy=0.5):
+    """
+    Band with the spins of every image translated (by whole lattice sites,
+    with the PBCs) to move the skyrmion core to the centre of the lattice,
+    so the same path taken in another part of the sample gives the same
+    band. Images without a core (see skyrmion_observables) are not moved
+    """
+    band = np.asarray(band, dtype=np.float64).reshape(-1, ny, nx, 3)
+    observables = skyrmion_observables(band, dx, dy)
+
+    aligned = np.empty_like(band)
+    for i, m in enumerate(band):
+        core_x, core_y = observables['core_x'][i], observables['core_y'][i]
+        if np.isnan(core_x):
+            aligned[i] = m
+            continue
+        shift_x = nx // 2 - int(np.floor(core_x / dx))
+        shift_y = ny // 2 - int(np.floor(core_y / dy))
+        aligned[i] = np.roll(np.roll(m, shift_x, axis=1), shift_y, axis=0)
+
+    return aligned.reshape(len(band), -1)
+
+
+def band_distance(band_a, band_b):
+    """
+    Mean angle (rad) between the spins of the corresponding images of two
+    bands with the same number of images
+    """
+    a = np.array([np.reshape(m, (-1, 3)) for m in band_a])
+    b = np.array([np.reshape(m, (-1, 3)) for m in band_b])
+
+    return np.mean(np.arccos(np.clip(np.sum(a * b, axis=-1), -1., 1.)))
+
+
+def group_paths(bands, barriers, tol=0.05, nx=21, ny=21, dx=0.5,
+                dy=0.5):
+    """
+    Group relaxed bands into distinct paths. The bands are aligned on the
+    skyrmion core (see align_band) and taken from the lowest barrier, and a
+    band joins the first path whose (lowest barrier) band is closer than
+    'tol' (see band_distance)
+
+    Returns a list with the lists of indexes of the bands of every path,
+    sorted by the barrier
+    """
+    bands = [align_band(band, nx, ny, dx, dy) for band in bands]
+
+    paths = []
+    for i in np.argsort(barriers):
+        for path in paths:
+            if band_distance(bands[path[0]], bands[i]) < tol:
+                path.append(i)
+                break
+        else:
+            paths.append([i])
+
+    return paths
+
+# -----------------------------------------------------------------------------
+
+
+# Ensemble --------------------------------------------------------------------
+
+def _save_npy(path, array):
+    # Write and rename so the main process never reads half a file
+    tmp = path[:-4] + '_{}.tmp.npy'.format(os.getpid())
+    np.save(tmp, array)
+    os.rename(tmp, path)
+
+
+def run_member(args):
+    """
+    Relax a band of the ensemble and return its row for the index
+    """
+    (outdir, label, k, maxst, stopping_dYdt,
+     J, D, B, mu_s, nx, ny, climbing) = args
+
+    folder = os.path.join(outdir, label)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+    init_im = list(np.load(os.path.join(outdir, 'initial_bands',
+                                        label + '.npy')))
+
+    # Fidimag saves the files in the working directory. The processes of the
+    # pool are reused so we always go back to the original directory
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        t0 = time.time()
+        relax_neb(k, maxst, label, init_im, None,
+                  stopping_dYdt=stopping_dYdt,
+                  climbing_image='auto' if climbing else None,
+                  J=J, D=D, B=B, mu_s=mu_s, nx=nx, ny=ny, resume=True,
+                  save_vtks=False)
+        band, energies = final_band(label)
+        # The first column is the step number
+        iterations = int(ndt_reader.tail(label + '_energy.ndt')[-1][0])
+    finally:
+        os.chdir(cwd)
+
+    _save_npy(os.path.join(outdir, 'final_bands', label + '.npy'),
+              np.array(band))
+
+    return [label, (np.max(energies) - energies[0]) / meV,
+            int(np.argmax(energies)), iterations, time.time() - t0]
+
+
+def load_index(outdir):
+    """
+    Dictionary with the rows of the index of an ensemble, by label
+    """
+    path = os.path.join(outdir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {}
+
+    rows = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip() and not line.startswith('#'):
+                row = line.split()
+                rows[row[0]] = [row[0], float(row[1]), int(row[2]),
+                                int(row[3]), float(row[4])]
+    return rows
+
+
+def save_paths(outdir, tol=0.05, nx=21, ny=21):
+    """
+    Group the finished bands of an ensemble into distinct paths (see
+    group_paths) and save them in the paths file. Returns the rows of the
+    file, the first one is the path with the lowest barrier
+    """
+    rows = load_index(outdir)
+    labels = sorted(rows)
+    bands = [np.load(os.path.join(outdir, 'final_bands', label + '.npy'))
+             for label in labels]
+    barriers = [rows[label][1] for label in labels]
+
+    table = []
+    for p, path in enumerate(group_paths(bands, barriers, tol, nx, ny)):
+        best = rows[labels[path[0]]]
+        table.append([p, best[0], best[1], best[2], len(path),
+                      ','.join(labels[i] for i in path)])
+
+    with open(os.path.join(outdir, PATHS_FILE), 'w') as f:
+        f.write('# ' + PATHS_HEADER + '\n')
+        for row in table:
+            f.write('{} {} {:.8f} {} {} {}\n'.format(*row))
+
+    return table
+
+
+def ensemble(outdir, m_sk, m_fm, n_images=18, k=1e4, maxst=2000,
+             stopping_dYdt=0.01, J=10., D=6., B=25., mu_s=2., nx=21, ny=21,
+             climbing=True, processes=None, tol=0.05, **band_options):
+    """
+    Relax the bands of an ensemble of initial paths (see ensemble_bands,
+    which receives the band_options) between the skyrmion m_sk and the
+    ferromagnetic state m_fm, skipping the bands already in the index of
+    'outdir'
+
+    climbing    :: Activate the climbing image in the relaxations, for
+                   accurate barriers (see relax_neb)
+
+    tol         :: Tolerance of the mean angle (rad) between the spins of
+                   two relaxed bands (aligned on the skyrmion core), to group
+                   them into the same path
+
+    Returns the rows of the paths file (see save_paths)
+
+    """
+    # Workers change their directory, so we use an absolute path
+    outdir = os.path.abspath(outdir)
+    for folder in ['initial_bands', 'final_bands']:
+        if not os.path.exists(os.path.join(outdir, folder)):
+            os.makedirs(os.path.join(outdir, folder))
+
+    done = load_index(outdir)
+    members = []
+    for label, band in ensemble_bands(m_sk, m_fm, n_images, nx, ny,
+                                      **band_options):
+        if label in done:
+            continue
+        path = os.path.join(outdir, 'initial_bands', label + '.npy')
+        # Interrupted bands are restarted from their saved steps
+        if not os.path.exists(path):
+            _save_npy(path, np.array(band))
+        members.append((outdir, label, k, maxst, stopping_dYdt,
+                        J, D, B, mu_s, nx, ny, climbing))
+
+    print('{} bands to relax ({} already finished)'.format(len(members),
+                                                           len(done)))
+
+    path = os.path.join(outdir, INDEX_FILE)
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            f.write('# ' + INDEX_HEADER + '\n')
+
+    if members:
+        pool = multiprocessing.Pool(processes)
+        try:
+            # Only this process writes to the index
+            for row in pool.imap_unordered(run_member, members):
+                with open(path, 'a') as f:
+                    f.write('{} {:.8f} {} {} {:.2f}\n'.format(*row))
+                print('Finished {} -- barrier: {:.4f} meV'.format(row[0],
+                                                                  row[1]))
+            pool.close()
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    return save_paths(outdir, tol, nx, ny)
+
+# -----------------------------------------------------------------------------
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ensemble of NEBM '
+                                     'relaxations from different initial '
+                                     'paths of the sk-fm system')
+    parser.add_argument('-o', '--outdir', default='ensemble')
+    parser.add_argument('--images', type=int, default=18)
+    parser.add_argument('--k', type=float, default=1e4)
+    parser.add_argument('--maxst', type=int, default=2000)
+    parser.add_argument('--stopping_dYdt', type=float, default=0.01)
+    parser.add_argument('--nx', type=int, default=21)
+    parser.add_argument('--ny', type=int, default=21)
+    parser.add_argument('--drifts', type=int, default=4,
+                        help='Number of directions of the drift paths')
+    parser.add_argument('--drift', type=float, default=None,
+                        help='Distance (nm) of the drift paths')
+    parser.add_argument('--noisy', type=int, default=2,
+                        help='Noisy copies of the geodesic and collapse '
+                        'paths')
+    parser.add_argument('--noise', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--tol', type=float, default=0.05,
+                        help='Mean angle (rad) between the spins of bands '
+                        'of the same path')
+    parser.add_argument('--no-climbing', action='store_true')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    # The relaxed states of the relaxation scripts, for the lattice size
+    m_sk = np.load(latest_npy('relaxation/{}_npys'.format(
+        relaxation_name('sk', args.nx, args.ny))))
+    m_fm = np.load(latest_npy('relaxation/{}_npys'.format(
+        relaxation_name('fm', args.nx, args.ny))))
+
+    paths = ensemble(args.outdir, m_sk, m_fm, args.images, k=args.k,
+                     maxst=args.maxst, stopping_dYdt=args.stopping_dYdt,
+                     nx=args.nx, ny=args.ny,
+                     climbing=not args.no_climbing,
+                     processes=args.processes, tol=args.tol,
+                     drifts=args.drifts, drift=args.drift,
+                     noisy=args.noisy, noise=args.noise, seed=args.seed)
+
+    for row in paths:
+        print('Path {}: barrier {:.4f} meV ({}, {} bands)'.format(
+            row[0], row[2], row[1], row[4]))
+    if paths:
+        print('Lowest barrier: {:.4f} meV ({})'.format(paths[0][2],
+                                                      paths[0][1]))
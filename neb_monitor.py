@@ -0,0 +1,181 @@
+from __future__ import print_function
+
+"""
+
+Live progress of a running NEBM relaxation
+
+The ProgressPublisher callback of an NEBM_Relaxation (see neb_relaxation.py)
+opens a local (Unix domain) socket
+
+    <simname>_progress.sock
+
+and every 'every' iterations sends to the connected viewers a JSON line with
+the step, the energies of the images (J), the distances between them (as in
+the _dYs.ndt table) and the largest dYdt (torque) of the band. When no
+viewer is connected the callback only counts the iterations and, every
+'every' iterations, checks the socket for new connections without waiting,
+so the relaxation is not slowed down. Viewers that do not read their messages are
+disconnected instead of blocking the relaxation.
+
+A running simulation (relax_neb with monitor_every) is watched with:
+
+    python neb_monitor.py neb_21x21-spins_fm-sk_atomic_k1e4
+
+or, e.g. from a notebook, with the watch() generator.
+
+"""
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import json
+import os
+import socket
+import time
+
+# Energy unit of the viewer (fidimag.common.constant.meV)
+meV = 1.602176565e-22
+
+
+def progress_address(simname):
+    return simname + '_progress.sock'
+
+
+class ProgressPublisher(object):
+    """
+    Callback of an NEBM_Relaxation that publishes the progress of the
+    relaxation to the viewers connected to a local socket
+
+    address     :: Path of the socket
+
+    every       :: Number of iterations between messages
+
+    """
+
+    def __init__(self, address, every=10):
+        self.address = address
+        self.every = every
+        self.clients = []
+        self._calls = 0
+
+        # Socket of an interrupted simulation
+        if os.path.exists(address):
+            os.remove(address)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(address)
+        self._server.listen(4)
+        self._server.setblocking(False)
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except socket.error:
+                return
+            client.setblocking(False)
+            self.clients.append(client)
+
+    def _send(self, data):
+        for client in list(self.clients):
+            try:
+                sent = client.send(data)
+            except socket.error:
+                sent = None
+            # A partial message would break the stream of the viewer
+            if sent != len(data):
+                self.clients.remove(client)
+                client.close()
+
+    def message(self, neb, dYdt):
+        climbing = neb.climbing_image
+        if climbing is not None:
+            climbing = np.atleast_1d(climbing).astype(int).tolist()
+
+        return {'simname': neb.name,
+                'step': int(neb.iterations + getattr(neb, 'step_offset', 0)),
+                'energies': np.asarray(neb.energies).tolist(),
+                'distances': np.asarray(neb.distances).tolist(),
+                'dYdt': float(dYdt),
+                'climbing_image': climbing}
+
+    def __call__(self, neb, dYdt):
+        self._calls += 1
+        if self._calls % self.every:
+            return None
+
+        self._accept()
+        if self.clients:
+            self._send((json.dumps(self.message(neb, dYdt)) +
+                        '\n').encode())
+
+        return None
+
+    def close(self):
+        for client in self.clients:
+            client.close()
+        self.clients = []
+        self._server.close()
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+
+def watch(simname, wait=0.):
+    """
+    Generator with the progress messages (dictionaries) of a running
+    simulation, until it finishes. If the simulation is not running, the
+    socket is polled for 'wait' seconds
+    """
+    address = progress_address(simname)
+    start = time.time()
+    while True:
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            client.connect(address)
+            break
+        except socket.error:
+            client.close()
+            if time.time() - start >= wait:
+                raise IOError('The simulation {} is not running (no '
+                              '{} socket)'.format(simname, address))
+            time.sleep(0.5)
+
+    stream = client.makefile('r')
+    try:
+        for line in stream:
+            yield json.loads(line)
+    finally:
+        stream.close()
+        client.close()
+
+
+def summary(message):
+    """
+    One line with the state of the band
+    """
+    energies = np.array(message['energies'])
+    saddle = int(np.argmax(energies))
+    barrier = (energies[saddle] - energies[0]) / meV
+
+    return ('step {:>7}  max dYdt {:.3e}  barrier {:.4f} meV (image {}) '
+            ' path length {:.4f}'.format(message['step'], message['dYdt'],
+                                         barrier, saddle,
+                                         np.sum(message['distances'])))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Watch the progress of a '
+                                     'running NEBM simulation')
+    parser.add_argument('simname')
+    parser.add_argument('--wait', type=float, default=60.,
+                        help='Seconds to wait for the simulation to start')
+    parser.add_argument('--energies', action='store_true',
+                        help='Print the energies (meV) of the images')
+    args = parser.parse_args()
+
+    for message in watch(args.simname, args.wait):
+        print(summary(message))
+        if args.energies:
+            energies = np.array(message['energies'])
+            print(' '.join('{:.3f}'.format(e)
+                           for e in (energies - energies[0]) / meV))
@@ -0,0 +1,130 @@
+from __future__ import print_function
+
+"""
+
+Profiling of the iterations of an NEBM relaxation
+
+The NEBMProfiler replaces the methods of an NEBM object that do the work of
+every iteration with timed versions, and saves the time spent on every part
+in the <simname>_profile.ndt table, with a row for every iteration (the
+first column is the step number, as in the other .ndt tables):
+
+    field       :: Effective field and energy of the images
+    distances   :: Geodesic distances between images
+    tangents    :: Tangents of the band
+    spring      :: Spring force and projections into the tangent space
+    integrator  :: Rest of the iteration (integration of the band, norms,
+                   .ndt tables)
+    npys, vtks  :: Saving the band files
+
+Times are exclusive, i.e. the time of the field is not included in the time
+of the integrator. Methods that the NEBM class does not have are not timed.
+
+"""
+
+import time
+
+# Parts of an iteration and the NEBM methods timed for every part
+TIMED_METHODS = [('field', 'compute_effective_field_and_energy'),
+                 ('distances', 'compute_distances'),
+                 ('tangents', 'compute_tangents'),
+                 ('spring', 'compute_spring_force'),
+                 ('integrator', 'run_until'),
+                 ('npys', 'save_npys'),
+                 ('vtks', 'save_VTKs')]
+
+PARTS = [part for part, method in TIMED_METHODS]
+
+
+class NEBMProfiler(object):
+    """
+    Time the iterations of an NEBM object
+
+    neb         :: NEBM object, before calling relax()
+
+    simname     :: The times are saved in the <simname>_profile.ndt file
+
+    """
+
+    def __init__(self, neb, simname):
+        self.neb = neb
+        self.totals = dict((part, 0.) for part in PARTS)
+        self.current = dict((part, 0.) for part in PARTS)
+        self.iterations = 0
+        # Time of the children of the timed methods being executed
+        self._stack = []
+        self._rows = []
+
+        self.filename = simname + '_profile.ndt'
+        self._file = open(self.filename, 'w')
+        self._file.write('# step ' + ' '.join(PARTS) + ' total\n')
+        self._file.write('# - ' + ' '.join(['s'] * (len(PARTS) + 1)) + '\n')
+
+        for part, method in TIMED_METHODS:
+            if hasattr(neb, method):
+                setattr(neb, method, self._timed(part, getattr(neb, method)))
+
+    def _timed(self, part, function):
+        def timed_function(*args, **kwargs):
+            # An iteration starts when the band is integrated, so the saving
+            # of files is included in the iteration before it
+            if part == 'integrator' and not self._stack:
+                self.save_iteration()
+
+            self._stack.append(0.)
+            t0 = time.time()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = time.time() - t0
+                children = self._stack.pop()
+                self.current[part] += elapsed - children
+                if self._stack:
+                    self._stack[-1] += elapsed
+
+        return timed_function
+
+    def save_iteration(self):
+        """
+        Add the times of the current iteration to the table and the totals
+        """
+        total = sum(self.current.values())
+        if total == 0:
+            return
+
+        step = getattr(self.neb, 'iterations', self.iterations)
+        self._rows.append('{} '.format(step) +
+                          ' '.join('{:.6e}'.format(self.current[p])
+                                   for p in PARTS) +
+                          ' {:.6e}\n'.format(total))
+        # Write the rows in blocks to reduce the overhead
+        if len(self._rows) >= 100:
+            self._file.writelines(self._rows)
+            self._rows = []
+
+        for part in PARTS:
+            self.totals[part] += self.current[part]
+            self.current[part] = 0.
+        self.iterations += 1
+
+    def close(self):
+        self.save_iteration()
+        self._file.writelines(self._rows)
+        self._rows = []
+        self._file.close()
+
+    def summary(self):
+        """
+        Text with the total times of the parts of the iterations
+        """
+        total = sum(self.totals.values()) or 1.
+        lines = ['Profile of {} iterations ({})'.format(self.iterations,
+                                                       self.filename),
+                 '{:<12} {:>12} {:>8} {:>14}'.format('Part', 'Total (s)',
+                                                     '%', 'Per iter (ms)')]
+        for part in sorted(PARTS, key=lambda p: -self.totals[p]):
+            lines.append('{:<12} {:>12.3f} {:>7.1f}% {:>14.3f}'.format(
+                part, self.totals[part], 100 * self.totals[part] / total,
+                1e3 * self.totals[part] / max(self.iterations, 1)))
+
+        return '\n'.join(lines)
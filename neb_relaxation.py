@@ -0,0 +1,731 @@
+from __future__ import print_function
+
+"""
+
+Reusable functions to relax the states of the toy model of Fe-like atoms
+arranged in a square lattice with interfacial DMI, and to run the NEBM on the
+energy band between them.
+
+These functions were extracted from the simulation scripts so the material
+parameters and the lattice size can be varied, e.g. by the parameter sweep
+driver (sweep_neb.py). The default arguments reproduce the system of the
+paper:
+
+Magnetic parameters:
+    J = 10 meV      Exchange
+    D = 6 meV       DMI
+    B = 25 T        Magnetic Field
+    mu_s = 2 mu_B   Magnetic moment
+
+on a 21 x 21 spins square lattice with a lattice constant of 5 angstrom and
+PBCs
+
+"""
+
+# Mesh and simulation objects of the system
+from system_builder import generate_mesh, generate_sim, neb_sim
+
+# Import the NEB method
+from fidimag.common.nebm_geodesic import NEBM_Geodesic
+
+# Checkpoint and restart of the NEBM relaxations
+import neb_checkpoint
+from neb_climbing import AutoClimbing
+from band_store import BandStore
+import ndt_reader
+from neb_profile import NEBMProfiler
+from neb_monitor import ProgressPublisher, progress_address
+import snapshot_writer
+import multigrid
+
+# Numpy utilities
+import numpy as np
+
+import glob
+import os
+
+
+# Initial states --------------------------------------------------------------
+
+# Slightly random state to get the uniform state with a magnetic field
+def init_m_fm(pos):
+
+    return (0, 0.8, 0.8)
+
+
+def init_m_sk(nx=21, ny=21, in_radius=2, centre=None):
+    """
+    Return a function with a small region of inverted spins, which will be
+    the skyrmion core. By default the region is at the centre of the sample
+    """
+    if centre is None:
+        centre = (nx * 0.5 * 0.5, ny * 0.5 * 0.5)
+    xc, yc = centre
+
+    def init_m(pos):
+        x, y = pos[0] - xc, pos[1] - yc
+
+        if x ** 2 + y ** 2 < in_radius ** 2:
+            return (0, 0, -1)
+        else:
+            return (0, 0, 1)
+
+    return init_m
+
+# -----------------------------------------------------------------------------
+
+
+# Relaxation Function ---------------------------------------------------------
+
+def relax_state(init_m, simname,
+                J=10., D=6., B=25., mu_s=2., nx=21, ny=21, dx=0.5, dy=0.5,
+                tols=None, save_steps=None, multigrid_levels=0, cache=None):
+    """
+    Relax a state with the LLG equation without precession and return a copy
+    of the final spin array
+
+    init_m      :: Initial magnetisation, any argument accepted by set_m
+
+    simname     :: Simulation name
+
+    tols        :: Optional tuple (rtol, atol) for the integrator
+
+    save_steps  :: Save VTK and NPY files every 'save_steps' number of steps
+                   (None to not save files)
+
+    multigrid_levels
+                :: Number of coarse versions of the lattice where the state
+                   is relaxed first (see coarse_relaxed_state)
+
+    cache       :: ArtifactCache object (see artifact_cache.py). The relaxed
+                   state is loaded from the cache if a state was relaxed with
+                   the same initial state and parameters, unless files are
+                   saved (save_steps)
+
+    """
+    if cache is not None and save_steps is None:
+        key = cache.key('relax_state', init_m, J, D, B, mu_s, nx, ny, dx, dy,
+                        tols, multigrid_levels)
+        cached = cache.load_arrays(key)
+        if cached is not None:
+            return cached[0]
+
+        m = relax_state(init_m, simname, J, D, B, mu_s, nx, ny, dx, dy,
+                        tols=tols, multigrid_levels=multigrid_levels)
+        cache.save_arrays(key, [m])
+        return m
+
+    if multigrid_levels > 0:
+        init_m = coarse_relaxed_state(init_m, simname, J, D, B, mu_s, nx, ny,
+                                      dx, dy, multigrid_levels, tols, cache)
+
+    # A new simulation (with the cached mesh) since the LLG driver keeps
+    # the state of the integration
+    sim = generate_sim(generate_mesh(nx, ny, dx, dy), simname, J, D, B, mu_s)
+    sim.set_m(init_m)
+
+    # Tune the damping for faster convergence
+    sim.driver.alpha = 0.5
+    # Remove precession
+    sim.driver.do_precession = False
+
+    if tols is not None:
+        sim.driver.set_tols(rtol=tols[0], atol=tols[1])
+
+    sim.relax(dt=1e-13,
+              stopping_dmdt=0.01,
+              max_steps=5000,
+              save_m_steps=save_steps, save_vtk_steps=save_steps)
+
+    return np.copy(sim.spin)
+
+
+def coarse_relaxed_state(init_m, simname,
+                         J=10., D=6., B=25., mu_s=2., nx=21, ny=21,
+                         dx=0.5, dy=0.5, levels=1, tols=None, cache=None):
+    """
+    Relax a state on the coarse version of the lattice, with 2 times fewer
+    spins along every direction (see multigrid.py), and return it
+    interpolated into the lattice, to be used as the initial state of the
+    relaxation. With more than one level, the coarse state is also relaxed
+    from a coarser lattice first. The coarse simulations are named
+    '<simname>-coarse'
+    """
+    cnx, cny, cdx, cdy = multigrid.coarse_lattice(nx, ny, dx, dy)
+    cJ, cD, cB, cmu_s = multigrid.coarse_parameters(J, D, B, mu_s,
+                                                    nx, ny, dx, dy)
+    # Functions of the position and uniform states work on any lattice
+    if not callable(init_m) and np.size(init_m) == 3 * nx * ny:
+        init_m = multigrid.resample(init_m, (nx, ny), (cnx, cny))
+
+    m = relax_state(init_m, simname + '-coarse',
+                    cJ, cD, cB, cmu_s, cnx, cny, cdx, cdy,
+                    tols=tols, multigrid_levels=levels - 1, cache=cache)
+
+    return multigrid.resample(m, (cnx, cny), (nx, ny))
+
+
+def latest_npy(basedir):
+    """
+    Path of the latest relaxed state in a relaxation npys folder.
+    Files are named: m_156.npy, for example
+    """
+    npys = sorted(os.listdir(basedir), key=lambda x: int(x[2:-4]))
+
+    return os.path.join(basedir, npys[-1])
+
+# -----------------------------------------------------------------------------
+
+
+# NEBM Class ------------------------------------------------------------------
+
+class NEBM_Relaxation(NEBM_Geodesic):
+    """
+    NEBM with Geodesic distances which optionally saves the bands in a single
+    file store (see band_store.py) instead of the npys/ folders, and can save
+    the snapshots in a background thread
+
+    band_store  :: BandStore object, or None to save NPY folders
+
+    step_offset :: Number added to the iterations when saving the bands in
+                   the store, for relaxations restarted from a saved band
+
+    writer      :: AsyncWriter object (see snapshot_writer.py) to save the
+                   NPY and VTK files in the background, or None to save them
+                   before continuing the relaxation
+
+    save_vtks   :: If False, VTK files are not saved (they can be generated
+                   from the NPY files with export_vtks.py)
+
+    dtype       :: Data type of the saved NPY files or bands in the store,
+                   e.g. np.float32 to halve their size
+
+    callbacks   :: List of functions called after every iteration as
+                   callback(neb, dYdt), where dYdt is the largest change of
+                   the band in the iteration. A callback can return a new
+                   value for dYdt, which is used in the stopping criteria
+
+    """
+
+    def __init__(self, sim, initial_images, band_store=None, step_offset=0,
+                 writer=None, save_vtks=True, dtype=np.float64,
+                 callbacks=None, **kwargs):
+        super(NEBM_Relaxation, self).__init__(sim, initial_images, **kwargs)
+        self.band_store = band_store
+        self.step_offset = step_offset
+        self.writer = writer
+        self.save_vtks = save_vtks
+        self.dtype = np.dtype(dtype)
+        self.callbacks = list(callbacks or [])
+
+    def run_until(self, *args, **kwargs):
+        dYdt = super(NEBM_Relaxation, self).run_until(*args, **kwargs)
+        for callback in self.callbacks:
+            new_dYdt = callback(self, dYdt)
+            if new_dYdt is not None:
+                dYdt = new_dYdt
+
+        return dYdt
+
+    def set_climbing_image(self, images):
+        """
+        Make the images in the 'images' list climb up in energy from the
+        next iteration
+        """
+        self.climbing_image = list(images)
+        # Per image flags used by the NEBM to compute the forces
+        if hasattr(self, '_climbing_image'):
+            self._climbing_image[:] = 0
+            self._climbing_image[self.climbing_image] = 1
+
+    def _save(self, function, *args):
+        if self.writer is None:
+            function(*args)
+        else:
+            self.writer.submit(function, *args)
+
+    def save_npys(self, *args, **kwargs):
+        if (self.band_store is None and self.writer is None and
+                self.dtype == np.float64):
+            return super(NEBM_Relaxation, self).save_npys(*args, **kwargs)
+
+        # A copy of the band, which keeps changing during the relaxation
+        band = np.array(self.band.reshape(self.n_images, -1),
+                        dtype=self.dtype)
+        if self.band_store is not None:
+            self._save(self.band_store.append,
+                       self.iterations + self.step_offset, band)
+        else:
+            self._save(snapshot_writer.save_band_npys,
+                       'npys/{}_{}'.format(self.name, self.iterations), band)
+
+    def save_VTKs(self, *args, **kwargs):
+        if not self.save_vtks:
+            return
+
+        if self.writer is None:
+            return super(NEBM_Relaxation, self).save_VTKs(*args, **kwargs)
+
+        self._save(snapshot_writer.save_band_vtks,
+                   self.sim.mesh, np.copy(self.sim._mu_s),
+                   'vtks/{}_{}'.format(self.name, self.iterations),
+                   np.copy(self.band.reshape(self.n_images, -1)))
+
+# -----------------------------------------------------------------------------
+
+
+# Adaptive Band Refinement ----------------------------------------------------
+
+def refine_band(band, energies, max_images=None,
+                refine_tol=0.5, coarsen_tol=0.05):
+    """
+    Choose the images and interpolations of a new band from a relaxed band,
+    where the resolution is increased in the regions where the energy
+    curvature or the change of the path direction (tangent) is large, and
+    decreased in flat regions
+
+    band        :: List with the images of the relaxed band
+
+    energies    :: Array with the energies of the images
+
+    max_images  :: Maximum number of images of the new band
+
+    refine_tol  :: An image is interpolated between two images if one of them
+                   has a score larger than this value. The score of an image
+                   is the largest of its energy curvature and its path
+                   turning, relative to the maximum values along the band
+
+    coarsen_tol :: Images with a score (and neighbours with scores) smaller
+                   than this value are removed
+
+    Returns the list of images and the list of interpolations for
+    relax_neb
+
+    """
+    Y = np.array([np.asarray(m).reshape(-1) for m in band])
+    E = np.asarray(energies, dtype=np.float64)
+    n = len(E)
+
+    # Absolute second differences of the energy at the interior images
+    curvature = np.zeros(n)
+    curvature[1:-1] = np.abs(E[2:] - 2 * E[1:-1] + E[:-2])
+
+    # 1 - cos of the angle between consecutive segments of the path
+    segments = np.diff(Y, axis=0)
+    norms = np.linalg.norm(segments, axis=1)
+    turning = np.zeros(n)
+    turning[1:-1] = 1 - (np.sum(segments[1:] * segments[:-1], axis=1) /
+                         (norms[1:] * norms[:-1]))
+
+    score = np.zeros(n)
+    for quantity in [curvature, turning]:
+        if quantity.max() > 0:
+            score = np.maximum(score, quantity / quantity.max())
+
+    # Images around the saddle point are never removed
+    saddle = int(np.argmax(E))
+    keep = np.ones(n, dtype=bool)
+    for i in range(1, n - 1):
+        if (abs(i - saddle) > 1 and keep[i - 1] and
+                max(score[i - 1], score[i], score[i + 1]) < coarsen_tol):
+            keep[i] = False
+
+    images = [Y[i] for i in range(n) if keep[i]]
+    kept_scores = score[keep]
+
+    # Interpolate an image in the segments with the largest scores first
+    segment_scores = np.maximum(kept_scores[1:], kept_scores[:-1])
+    interp = np.zeros(len(images) - 1, dtype=int)
+    n_new = len(images)
+    for j in np.argsort(segment_scores)[::-1]:
+        if segment_scores[j] <= refine_tol:
+            break
+        if max_images is not None and n_new >= max_images:
+            break
+        interp[j] = 1
+        n_new += 1
+
+    return images, [int(i) for i in interp]
+
+
+def simulation_files(simname):
+    """
+    Files and folders of a simulation (and of its coarse, refinement and
+    restarted simulations) in the working directory
+    """
+    paths = []
+    for folder in ['', 'npys', 'vtks']:
+        for pattern in ['_*', '-*', 'interpolation.dat']:
+            paths.extend(glob.glob(os.path.join(folder, simname + pattern)))
+
+    return sorted(p for p in set(paths) if not p.endswith('.tmp'))
+
+
+def final_band(simname):
+    """
+    Return the latest band of a finished simulation and the energies of its
+    images
+    """
+    info = neb_checkpoint.load_checkpoint(simname)
+    step, band = neb_checkpoint.latest_band(simname, info['n_images'])
+    energies = ndt_reader.tail(simname + '_energy.ndt')[-1][1:]
+
+    return band, energies
+
+# -----------------------------------------------------------------------------
+
+
+# NEBM Simulation Function ----------------------------------------------------
+
+def relax_neb(k, maxst, simname, init_im, interp,
+              save_every=10000, stopping_dYdt=0.01,
+              climbing_image=None,
+              J=10., D=6., B=25., mu_s=2., nx=21, ny=21, dx=0.5, dy=0.5,
+              resume=False, band_store=False, binary_ndt=False,
+              multigrid_levels=0, adaptive_rounds=0, max_images=None,
+              profile=False, async_save=False, save_vtks=True,
+              climbing_dYdt=None, interpolation_points=None, cache=None,
+              band_dtype=np.float64, keyframe_every=None,
+              monitor_every=None, callbacks=None):
+    """
+    Execute a simulation with the NEBM algorithm of the FIDIMAG code
+
+    The mesh and the Simulation object are only created the first time this
+    function is called with a set of parameters (see system_builder.py)
+
+    k           :: NEBM spring constant
+
+    maxst       :: Maximum number of iterations
+
+    simname     :: Simulation name. VTK and NPY files are saved in folders
+                   starting with the 'simname' string
+
+    init_im     :: A list with magnetisation states (usually loaded from
+                   NPY files or from a function) that will be used as
+                   images in the energy band, e.g. for two states:
+                        [np.load('skyrmion.npy'), np.load('ferromagnet.npy')]
+
+    interp      :: Array or list with the numbers of interpolations between
+                   every pair of the 'init_im' list. The length of this array
+                   is: len(__init_im) - 1
+
+    save_every  :: Save VTK and NPY files every 'save_every' number of steps
+
+    climbing_image
+                :: Image (or list of images) that climbs up in energy. With
+                   'auto' (or 'auto-multiple') the band is relaxed without
+                   climbing images until its dYdt is smaller than
+                   climbing_dYdt, then the image with the largest energy
+                   (or one image at every saddle point) is chosen as the
+                   climbing image and the relaxation continues in the same
+                   run (see neb_climbing.py)
+
+    climbing_dYdt
+                :: dYdt at which the automatic climbing images are chosen.
+                   By default 10 times the stopping_dYdt
+
+    J, D, B,
+    mu_s        :: Material parameters, see generate_sim()
+
+    nx, ny      :: Number of spins of the square lattice
+
+    dx, dy      :: Lattice constants in nm
+
+    resume      :: Restart the relaxation from the latest saved band of the
+                   'simname' simulation, if there is one, keeping the step
+                   numbers, the .ndt history and the climbing image of the
+                   interrupted run (see neb_checkpoint.py). If the
+                   simulation already finished, it is not run again and None
+                   is returned
+
+    band_store  :: Save the bands in the npys/<simname>_band.dat file (see
+                   band_store.py) instead of a folder for every saved step
+
+    keyframe_every
+                :: With band_store, compress the store by saving a full band
+                   every 'keyframe_every' saved steps and only the changes
+                   of the bands in between (see band_store.py), e.g. to save
+                   the bands every few iterations
+
+    binary_ndt  :: Save a binary copy of the .ndt tables at the end of the
+                   relaxation, which is loaded by ndt_reader.load()
+
+    multigrid_levels
+                :: Number of coarse versions of the lattice used to relax
+                   the band first. The images of the initial band are
+                   coarsened (2 times fewer spins along every direction, see
+                   multigrid.py) and the band is relaxed on the coarse
+                   lattice, as the '<simname>-coarse' simulation, with a 10
+                   times larger stopping_dYdt. The relaxed images are then
+                   interpolated into the lattice (with the original
+                   extremes) as the initial band. With more than one level,
+                   the coarse band is also relaxed on a coarser lattice
+                   first. Restarted simulations skip this step
+
+    adaptive_rounds
+                :: Number of refinements of the band. The initial band,
+                   which should be coarse (few interpolations), is relaxed
+                   with a 10 times larger stopping_dYdt and then images are
+                   added and removed according to the energy curvature and
+                   the path direction (see refine_band). After the last
+                   refinement the band is relaxed as usual. The rounds are
+                   saved as '<simname>-round<N>' simulations and the
+                   climbing_image refers to the image of the final band
+
+    max_images  :: Maximum number of images of the refined bands
+
+    monitor_every
+                :: Publish the energies of the band and its largest dYdt
+                   every 'monitor_every' iterations to the viewers of the
+                   <simname>_progress.sock socket (see neb_monitor.py)
+
+    callbacks   :: List of functions called as callback(neb, dYdt) after
+                   every iteration of the relaxation of simname (see
+                   NEBM_Relaxation), e.g. to measure the relaxation
+
+    profile     :: Save the time spent on every part of the iterations in
+                   the <simname>_profile.ndt table and print a summary at the
+                   end (see neb_profile.py)
+
+    async_save  :: Save the NPY and VTK files in a background thread, while
+                   the relaxation continues. All the files are written
+                   before returning, also if the relaxation is interrupted
+
+    save_vtks   :: Save VTK files together with the NPY files. If False, the
+                   VTK files can be generated later with export_vtks.py
+
+    interpolation_points
+                :: If not None, save the cubic interpolation of the final
+                   band with this number of points (see save_interpolation)
+
+    cache       :: ArtifactCache object (see artifact_cache.py). The files of
+                   the simulation are saved in the cache when it finishes,
+                   and they are restored, instead of running the simulation,
+                   when a simulation was run with the same initial band and
+                   parameters (None is returned in this case). The
+                   interpolated initial band is also cached
+
+    band_dtype  :: Data type of the saved bands (NPY files or store). With
+                   np.float32 the files are half the size and the spins are
+                   renormalised when they are loaded (see band_store.py)
+
+    The NEBM object is returned after the relaxation
+
+    """
+
+    if cache is not None:
+        # Everything the files of the simulation depend on
+        cache_key = cache.key('relax_neb', k, maxst, init_im, interp,
+                              save_every, stopping_dYdt, climbing_image,
+                              climbing_dYdt, J, D, B, mu_s, nx, ny, dx, dy,
+                              band_store, binary_ndt, multigrid_levels,
+                              adaptive_rounds, max_images, save_vtks,
+                              interpolation_points, np.dtype(band_dtype).str,
+                              keyframe_every)
+        if (neb_checkpoint.load_checkpoint(simname) is None and
+                cache.restore_files(cache_key, prefix=simname)):
+            print('Simulation {} restored from the cache'.format(simname))
+            return None
+
+    started = resume and neb_checkpoint.load_checkpoint(simname) is not None
+    if multigrid_levels > 0 and not started:
+        cnx, cny, cdx, cdy = multigrid.coarse_lattice(nx, ny, dx, dy)
+        cJ, cD, cB, cmu_s = multigrid.coarse_parameters(J, D, B, mu_s,
+                                                        nx, ny, dx, dy)
+        coarse_name = simname + '-coarse'
+        relax_neb(k, maxst, coarse_name,
+                  [multigrid.resample(m, (nx, ny), (cnx, cny))
+                   for m in init_im],
+                  interp,
+                  save_every=save_every, stopping_dYdt=10 * stopping_dYdt,
+                  J=cJ, D=cD, B=cB, mu_s=cmu_s, nx=cnx, ny=cny, dx=cdx,
+                  dy=cdy, resume=resume, band_store=band_store,
+                  async_save=async_save, save_vtks=save_vtks,
+                  multigrid_levels=multigrid_levels - 1, cache=cache,
+                  band_dtype=band_dtype, keyframe_every=keyframe_every,
+                  monitor_every=monitor_every)
+
+        band, energies = final_band(coarse_name)
+        # The extremes are the energy minima of the original lattice
+        first, last = init_im[0], init_im[-1]
+        init_im = [multigrid.resample(m, (cnx, cny), (nx, ny)) for m in band]
+        init_im[0], init_im[-1] = first, last
+        interp = None
+
+    if adaptive_rounds > 0:
+        options = dict(save_every=save_every,
+                       J=J, D=D, B=B, mu_s=mu_s, nx=nx, ny=ny, dx=dx, dy=dy,
+                       resume=resume, band_store=band_store,
+                       profile=profile, async_save=async_save,
+                       save_vtks=save_vtks, climbing_dYdt=climbing_dYdt,
+                       cache=cache, band_dtype=band_dtype,
+                       keyframe_every=keyframe_every,
+                       monitor_every=monitor_every)
+        for r in range(adaptive_rounds):
+            round_name = '{}-round{}'.format(simname, r)
+            relax_neb(k, maxst, round_name, init_im, interp,
+                      stopping_dYdt=10 * stopping_dYdt, **options)
+            band, energies = final_band(round_name)
+            init_im, interp = refine_band(band, energies, max_images)
+            print('Refinement {}: {} -> {} images'.format(
+                r, len(band), len(init_im) + int(np.sum(interp))))
+
+        return relax_neb(k, maxst, simname, init_im, interp,
+                         stopping_dYdt=stopping_dYdt,
+                         climbing_image=climbing_image,
+                         binary_ndt=binary_ndt,
+                         interpolation_points=interpolation_points,
+                         callbacks=callbacks, **options)
+
+    name, offset = simname, 0
+    if resume:
+        # Files of previously restarted runs are moved to 'simname' first
+        neb_checkpoint.fold_segments(simname)
+        info = neb_checkpoint.load_checkpoint(simname)
+
+        if info is not None and info['finished']:
+            print('Simulation {} already finished'.format(simname))
+            return None
+
+        if info is not None:
+            step, band = neb_checkpoint.latest_band(simname,
+                                                    info['n_images'])
+            if step is not None:
+                print('Restarting {} from step {}'.format(simname, step))
+                # The band is already interpolated
+                init_im, interp = band, None
+                climbing_image = info['climbing_image']
+                if info.get('auto_climbing') and climbing_image is None:
+                    climbing_image = info['auto_climbing']
+                name, offset = neb_checkpoint.segment_name(simname, step), step
+                maxst = max(maxst - step, 0)
+
+    store = None
+    if band_store:
+        store = BandStore(simname, dtype=band_dtype,
+                          keyframe_every=keyframe_every)
+        # Bands saved after the restart step are from the interrupted run
+        store.truncate(offset - 1 if offset > 0 else -1)
+
+    # The automatic climbing images are chosen during the relaxation and
+    # saved in the checkpoint, so a restarted run keeps them
+    callbacks = list(callbacks or [])
+    auto_climbing = None
+    if climbing_image in ['auto', 'auto-multiple']:
+        auto_climbing, climbing_image = climbing_image, None
+        if climbing_dYdt is None:
+            climbing_dYdt = 10 * stopping_dYdt
+
+        def save_climbing_image(images):
+            neb_checkpoint.save_checkpoint(simname, climbing_image=images)
+
+        callbacks.append(AutoClimbing(climbing_dYdt,
+                                      multiple=auto_climbing.endswith(
+                                          'multiple'),
+                                      on_activation=save_climbing_image))
+
+    publisher = None
+    if monitor_every:
+        publisher = ProgressPublisher(progress_address(simname),
+                                      monitor_every)
+        callbacks.append(publisher)
+
+    if offset == 0:
+        n_images = len(init_im)
+        if interp is not None:
+            n_images += int(np.sum(interp))
+        neb_checkpoint.save_checkpoint(simname,
+                                       n_images=n_images,
+                                       climbing_image=climbing_image,
+                                       auto_climbing=auto_climbing,
+                                       spring_constant=k,
+                                       finished=False)
+
+    # The interpolated initial band
+    band_key = None
+    if cache is not None and interp is not None:
+        band_key = cache.key('initial_band', init_im, interp, nx, ny, dx, dy)
+        band = cache.load_arrays(band_key)
+        if band is not None:
+            init_im, interp, band_key = band, None, None
+
+    # A new simulation on the cached mesh of the lattice
+    sim = neb_sim(J, D, B, mu_s, nx, ny, dx, dy)
+
+    # Start a NEB simulation passing the Simulation object and all the NEB
+    # parameters. The number of interpolations must always be
+    # equal to 'the number of initial states specified', minus one.
+    writer = None
+    if async_save:
+        writer = snapshot_writer.AsyncWriter()
+
+    neb = NEBM_Relaxation(sim,
+                          init_im,
+                          band_store=store,
+                          step_offset=offset,
+                          writer=writer,
+                          save_vtks=save_vtks,
+                          dtype=band_dtype,
+                          callbacks=callbacks,
+                          interpolations=interp,
+                          spring_constant=k,
+                          name=name,
+                          climbing_image=climbing_image
+                          )
+
+    if band_key is not None:
+        cache.save_arrays(band_key, list(np.copy(neb.band.reshape(
+            neb.n_images, -1))))
+
+    if profile:
+        profiler = NEBMProfiler(neb, name)
+
+    # Finally start the energy band relaxation
+    try:
+        neb.relax(max_iterations=maxst,
+                  save_vtks_every=save_every,
+                  save_npys_every=save_every,
+                  stopping_dYdt=stopping_dYdt
+                  )
+    finally:
+        if writer is not None:
+            writer.close()
+        # Header of the store with the steps of the appended bands
+        if store is not None:
+            store.close()
+        if publisher is not None:
+            publisher.close()
+        if profile:
+            profiler.close()
+
+    if profile:
+        print(profiler.summary())
+
+    if offset > 0:
+        neb_checkpoint.fold_segments(simname)
+    neb_checkpoint.save_checkpoint(simname, finished=True)
+
+    if binary_ndt:
+        for table in ['_energy.ndt', '_dYs.ndt']:
+            ndt_reader.write_binary(simname + table)
+
+    if interpolation_points is not None:
+        save_interpolation(neb, simname, interpolation_points)
+
+    if cache is not None:
+        cache.save_files(cache_key, simulation_files(simname),
+                         prefix=simname)
+
+    return neb
+
+
+def save_interpolation(neb, simname, n_points=200):
+    """
+    Produce a file with the data from a cubic interpolation for the band,
+    using the information from the tangents
+    """
+    interp_data = np.zeros((n_points, 2))
+    interp_data[:, 0], interp_data[:, 1] = neb.compute_polynomial_approximation(n_points)
+    np.savetxt(simname + 'interpolation.dat', interp_data)
+
+# -----------------------------------------------------------------------------
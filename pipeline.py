@@ -0,0 +1,309 @@
+from __future__ import print_function
+
+"""
+
+Pipeline runner for the simulations and plots of this repository
+
+Every stage of the pipeline is a script with the files it reads (inputs) and
+the files or folders it produces (outputs). A stage depends on the stages
+producing its inputs, so the relaxations of the skyrmion and the
+ferromagnetic states, which are independent, run at the same time, as well as
+the NEBM and CI-NEBM simulations once both states are relaxed.
+
+A stage is skipped when its outputs are newer than its inputs (for folders
+we use their newest file). At the end, the wall time of every stage is
+reported. Examples:
+
+    python pipeline.py plot plot_climbing        # Everything, in parallel
+    python pipeline.py nebm -j 1                 # Serial
+    python pipeline.py relaxation --force        # Run even if up to date
+    python pipeline.py nebm --nx 101 --images 24 --float32
+
+The lattice size, the number of images, the precision of the saved bands and
+the multigrid levels of the relaxations (--multigrid) are passed to the
+scripts in environment variables (see system_options.py).
+
+"""
+
+from system_options import (option_environment, simulation_name,
+                            relaxation_name)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+class Stage(object):
+    """
+    A step of the pipeline
+
+    name        :: Name of the stage
+
+    command     :: List with the arguments of the process
+
+    inputs      :: Files or folders read by the stage
+
+    outputs     :: Files or folders produced by the stage
+
+    cwd         :: Directory where the command is executed
+
+    """
+
+    def __init__(self, name, command, inputs, outputs, cwd='.'):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+        self.cwd = cwd
+
+
+# File with the options of the scripts (see system_options.py), an input of
+# the simulations, so they run again when the options change
+OPTIONS_FILE = 'pipeline_options.json'
+
+
+def build_stages(nx=21, ny=21, images=18, float32=False):
+    """
+    Stages of the pipeline for a lattice of nx x ny spins and bands of
+    'images' images
+    """
+    neb = simulation_name('neb', nx, ny, images=images, float32=float32)
+    climbing = simulation_name('climbing_image_neb', nx, ny, images=images,
+                               float32=float32)
+    relax_fm = 'relaxation/{}_npys'.format(relaxation_name('fm', nx, ny))
+    relax_sk = 'relaxation/{}_npys'.format(relaxation_name('sk', nx, ny))
+
+    return [
+        Stage('relax_fm', [sys.executable, 'ferromagnetic.py'],
+              inputs=['relaxation/ferromagnetic.py', 'system_builder.py',
+                      OPTIONS_FILE],
+              outputs=[relax_fm],
+              cwd='relaxation'),
+        Stage('relax_sk', [sys.executable, 'skyrmion.py'],
+              inputs=['relaxation/skyrmion.py', 'system_builder.py',
+                      OPTIONS_FILE],
+              outputs=[relax_sk],
+              cwd='relaxation'),
+        Stage('nebm', [sys.executable, 'neb_simulation_sk-fm.py'],
+              inputs=['neb_simulation_sk-fm.py', 'neb_relaxation.py',
+                      'system_builder.py', OPTIONS_FILE,
+                      relax_fm, relax_sk],
+              outputs=[neb + '_energy.ndt', neb + '_dYs.ndt',
+                       neb + 'interpolation.dat']),
+        Stage('climbing',
+              [sys.executable, 'climbing_image_neb_simulation_sk-fm.py'],
+              inputs=['climbing_image_neb_simulation_sk-fm.py',
+                      'neb_relaxation.py', 'neb_climbing.py',
+                      'system_builder.py', OPTIONS_FILE,
+                      relax_fm, relax_sk],
+              outputs=[climbing + '_energy.ndt', climbing + '_dYs.ndt']),
+        Stage('plot', [sys.executable, 'plot_ebds.py'],
+              inputs=['plot_ebds.py',
+                      neb + '_energy.ndt', neb + '_dYs.ndt',
+                      neb + 'interpolation.dat'],
+              outputs=['energy_band.pdf']),
+        Stage('plot_climbing',
+              [sys.executable, 'generate_snapshots_climbing_image.py'],
+              inputs=['generate_snapshots_climbing_image.py',
+                      climbing + '_energy.ndt', climbing + '_dYs.ndt'],
+              outputs=['climbing_image_snaps']),
+        Stage('animation',
+              [sys.executable, 'generate_snapshots_climbing_image.py',
+               '--output', 'climbing_image.gif'],
+              inputs=['generate_snapshots_climbing_image.py',
+                      'animation_writer.py',
+                      climbing + '_energy.ndt', climbing + '_dYs.ndt'],
+              outputs=['climbing_image.gif']),
+        Stage('htst', [sys.executable, 'htst.py', climbing,
+                       '--nx', str(nx), '--ny', str(ny)],
+              inputs=['htst.py', climbing + '_energy.ndt'],
+              outputs=[climbing + '_htst.txt']),
+        Stage('observables', [sys.executable, 'skyrmion_observables.py',
+                              neb, climbing, '--nx', str(nx), '--ny', str(ny)],
+              inputs=['skyrmion_observables.py',
+                      neb + '_energy.ndt', climbing + '_energy.ndt'],
+              outputs=['{}_{}.ndt'.format(simname, name)
+                       for simname in [neb, climbing]
+                       for name in ['Q', 'core_x', 'core_y', 'radius',
+                                    'min_mz']]),
+    ]
+
+
+STAGES = build_stages()
+
+
+def save_options(environment):
+    """
+    Save the options of the scripts in the OPTIONS_FILE, only if they
+    changed, so the simulations are not run again with the same options
+    """
+    if os.path.exists(OPTIONS_FILE):
+        with open(OPTIONS_FILE) as f:
+            if json.load(f) == environment:
+                return
+
+    with open(OPTIONS_FILE, 'w') as f:
+        json.dump(environment, f)
+
+
+# Names for groups of stages
+ALIASES = {'relaxation': ['relax_fm', 'relax_sk']}
+
+
+def modification_time(path):
+    """
+    Modification time of a file or of the newest file in a folder (None if
+    the path or the folder files do not exist)
+    """
+    if not os.path.exists(path):
+        return None
+
+    if not os.path.isdir(path):
+        return os.path.getmtime(path)
+
+    times = [os.path.getmtime(os.path.join(root, f))
+             for root, dirs, files in os.walk(path) for f in files]
+    if not times:
+        return None
+
+    return max(times)
+
+
+def up_to_date(stage):
+    outputs = [modification_time(p) for p in stage.outputs]
+    if None in outputs:
+        return False
+
+    inputs = [modification_time(p) for p in stage.inputs]
+    inputs = [t for t in inputs if t is not None]
+
+    return not inputs or min(outputs) >= max(inputs)
+
+
+def dependencies(stage, stages):
+    """
+    Names of the stages producing the inputs of a stage
+    """
+    return set(s.name for s in stages
+               if s is not stage and set(s.outputs) & set(stage.inputs))
+
+
+def required_stages(targets, stages):
+    """
+    The stages of the targets and all the stages they depend on
+    """
+    by_name = dict((s.name, s) for s in stages)
+    names = []
+    for t in targets:
+        names.extend(ALIASES.get(t, [t]))
+
+    required = set()
+    while names:
+        name = names.pop()
+        if name not in by_name:
+            raise ValueError('Unknown stage: {}'.format(name))
+        if name not in required:
+            required.add(name)
+            names.extend(dependencies(by_name[name], stages))
+
+    return [s for s in stages if s.name in required]
+
+
+def run_pipeline(targets, jobs=None, force=False, stages=STAGES):
+    """
+    Run the stages required by the targets, running up to 'jobs' stages at
+    the same time (no limit by default). Returns a dictionary with the wall
+    time of every stage that was run, or None if it failed
+    """
+    pending = required_stages(targets, stages)
+    deps = dict((s.name, dependencies(s, pending)) for s in pending)
+    running, finished, timings = {}, set(), {}
+    lock = threading.Condition()
+
+    def run(stage):
+        t0 = time.time()
+        print('[{}] {}'.format(stage.name, ' '.join(stage.command)))
+        code = subprocess.call(stage.command, cwd=stage.cwd)
+        with lock:
+            timings[stage.name] = time.time() - t0 if code == 0 else None
+            del running[stage.name]
+            finished.add(stage.name)
+            lock.notify()
+
+    with lock:
+        while True:
+            # No more stages are started after a failure
+            failed = None in timings.values()
+            started = False
+            for stage in list(pending):
+                if failed or (jobs and len(running) >= jobs):
+                    break
+                if not deps[stage.name] <= finished:
+                    continue
+
+                pending.remove(stage)
+                started = True
+                # A stage is only skipped if its dependencies were skipped
+                if (not force and up_to_date(stage) and
+                        not deps[stage.name] & set(timings)):
+                    print('[{}] up to date'.format(stage.name))
+                    finished.add(stage.name)
+                    continue
+
+                running[stage.name] = threading.Thread(target=run,
+                                                       args=(stage,))
+                running[stage.name].start()
+
+            # Skipped stages can make other stages ready
+            if started:
+                continue
+            if not running:
+                break
+            lock.wait()
+
+    print('\nStage              Wall time (s)')
+    for stage in stages:
+        if stage.name in timings:
+            t = timings[stage.name]
+            print('{:<18} {}'.format(stage.name,
+                                     'FAILED' if t is None else
+                                     '{:.1f}'.format(t)))
+
+    return timings
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stages of the '
+                                     'simulation pipeline')
+    parser.add_argument('targets', nargs='+',
+                        help='Stages: {}'.format(', '.join(
+                            [s.name for s in STAGES] + list(ALIASES))))
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Maximum number of stages running at once')
+    parser.add_argument('--force', action='store_true',
+                        help='Run the stages even if they are up to date')
+    parser.add_argument('--nx', type=int, default=21)
+    parser.add_argument('--ny', type=int, default=None,
+                        help='Number of spins along y (nx by default)')
+    parser.add_argument('--images', type=int, default=18)
+    parser.add_argument('--float32', action='store_true',
+                        help='Save the bands in single precision')
+    parser.add_argument('--multigrid', type=int, default=0,
+                        help='Relax the states first on this number of '
+                        'coarse lattices')
+    args = parser.parse_args()
+
+    ny = args.nx if args.ny is None else args.ny
+    environment = option_environment(args.nx, ny, args.images, args.float32,
+                                     args.multigrid)
+    os.environ.update(environment)
+    save_options(environment)
+
+    timings = run_pipeline(args.targets, jobs=args.jobs, force=args.force,
+                           stages=build_stages(args.nx, ny, args.images,
+                                               args.float32))
+    sys.exit(1 if None in timings.values() else 0)
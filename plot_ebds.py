@@ -4,6 +4,9 @@ import matplotlib.pyplot as plt
 import matplotlib
 import numpy as np
 
+from band_history import BandHistory
+from system_options import script_options, simulation_name
+
 # Matplotlib tweaks -----------------------------------------------------------
 matplotlib.rcParams.update({'font.size': 22})
 matplotlib.rcParams.update({'xtick.labelsize': 22})
@@ -30,30 +33,25 @@ def modify_splines(ax, lwd=0.75, col='0.8'):
 x_scale = 1
 meV = 1e-3 * 1.602e-19
 
-# We load the last step. The first column is the step number, which we get rid
-# of in the dYs file (dYs are the differences between images)
-data_energy = np.loadtxt('neb_21x21-spins_fm-sk_'
-                         'atomic_k1e4_energy.ndt')[-1]
-data_dYs = np.loadtxt('neb_21x21-spins_fm-sk'
-                      '_atomic_k1e4_dYs.ndt')[-1][1:]
-
-# We will plot relatively to the skyrmion energy
-sk_energy = np.ones(len(data_energy[1:])) * data_energy[1]
-
-# Scale the x axis (distances)
-data_dYs *= x_scale
-
-# Compute the total distance of a point from one of the extremes
-# (the extremes are energy minima). It is only necessary to
-# sum the distances up an specific point
-dYs = [0]
-for i in range(len(data_dYs)):
-    dYs.append(np.sum(data_dYs[:i + 1]))
+# The simulation of the options of the pipeline (see system_options.py)
+options = script_options()
+simname = simulation_name('neb', options['nx'], options['ny'],
+                          images=options['images'],
+                          float32=options['float32'])
+
+# We load the last iteration, reading only the end of the tables (see
+# band_history.py). The energies are plotted relative to the skyrmion energy
+# against the total distance of every image from the skyrmion (the extremes
+# are energy minima)
+history = BandHistory(simname)
+energies = history.energies[-1, :]
+dYs = history.distances[-1, :] * x_scale
+sk_energy = np.ones(len(energies)) * energies[0]
 
 # -----------------------------------------------------------------------------
 
 # Cubic Interpolation of the energy band
-interp_data = np.loadtxt('neb_21x21-spins_fm-sk_atomic_k1e4interpolation.dat')
+interp_data = np.loadtxt(simname + 'interpolation.dat')
 # Scale the energy and make it relative to the sk energy:
 interp_data[:, 1] /= meV
 interp_data[:, 1] = interp_data[:, 1] - interp_data[:, 1][0]
@@ -67,7 +65,7 @@ ax = fig.add_subplot(111)
 ax.plot(interp_data[:, 0], interp_data[:, 1], '-', lw=3, color='#FF5900')
 
 # Energy from the images
-ax.plot(dYs, (data_energy[1:] - sk_energy) / meV, 'ko', ms=8)
+ax.plot(dYs, (energies - sk_energy) / meV, 'ko', ms=8)
 
 # Decorations
 remove_ticks(ax)
@@ -84,13 +82,15 @@ ax.set_ylabel(r'Energy  [ ' + 'meV' + r' ]')
 
 # plt.legend(loc='upper left')
 
-ax.set_ylim([-15, 44])
-ax.set_xlim([-1, 15])
+# The limits are for the 21 x 21 spins system
+if (options['nx'], options['ny']) == (21, 21):
+    ax.set_ylim([-15, 44])
+    ax.set_xlim([-1, 15])
 
 # Annotate numbers extracting the position
 # from the  plot curve and shift the y position a little
 x, y = ax.lines[1].get_data()[0], ax.lines[1].get_data()[1]
-for i in range(18):
+for i in range(len(x)):
     ax.text(x[i], y[i] + 1.5,
             '{}'.format(i),
             fontsize=15,
@@ -2,7 +2,8 @@
 
 Relaxation to get a ferromagnetic state using Fidimag for a toy model made of
 Fe-like atoms arranged in a square lattice. This system is described by 21 x 21
-spins with interfacial DMI and a lattice constant of 5 Angstrom
+spins with interfacial DMI and a lattice constant of 5 Angstrom (other sizes
+can be set with the options in system_options.py)
 
 A very strong magnetic field B is applied perpendicular to the sample.
 
@@ -22,14 +23,26 @@ Contact to: d.i.cortes@soton.ac.uk
 # Numpy utilities
 import numpy as np
 
-# FIDIMAG Simulation imports:
-from fidimag.atomistic import Sim
-from fidimag.common import CuboidMesh
-from fidimag.atomistic import DMI
-from fidimag.atomistic import UniformExchange
-from fidimag.atomistic import Zeeman
-# Import physical constants from fidimag
-import fidimag.common.constant as const
+import os
+import sys
+
+# Mesh and simulation objects of the system, from the main folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+from system_builder import generate_mesh, generate_sim
+from neb_relaxation import coarse_relaxed_state
+from artifact_cache import ArtifactCache
+from system_options import script_options, relaxation_name
+
+# Lattice size, 21 x 21 spins by default, and number of coarse lattices of
+# the multigrid relaxation, 0 by default (see system_options.py)
+options = script_options()
+nx, ny = options['nx'], options['ny']
+multigrid_levels = options['multigrid']
+
+# The states are saved in the relax_fm_<nx>x<ny>_npys folder, so the
+# states of different lattice sizes do not overwrite each other
+simname = relaxation_name('fm', nx, ny)
 
 
 # Define an initial state for the magnetisation as a function of space
@@ -45,46 +58,45 @@ def init_m(pos):
             0.8)
 
 
+# CACHE -----------------------------------------------------------------------
+# If the state was already relaxed with the same initial state, parameters and
+# tolerances, the NPY files are restored from the cache (see
+# artifact_cache.py) instead of running the relaxation
+cache = ArtifactCache()
+cache_key = cache.key(simname, init_m, nx, ny, 10., 6., 25., 2., None,
+                      multigrid_levels)
+if cache.restore_files(cache_key):
+    print('Relaxed state restored from the cache')
+    sys.exit(0)
+
+# -----------------------------------------------------------------------------
+
 # MESH --------------------------------------------------------------------
-# This is a 21x21 spins in a square lattice with a lattice constant of 5
-# angstrom and PBCs
-mesh = CuboidMesh(nx=21, ny=21,
-                  dx=0.5, dy=0.5,
-                  unit_length=1e-9,
-                  periodicity=(True, True, False)
-                  )
+# This is a 21x21 spins (by default) square lattice with a lattice constant of
+# 5 angstrom and PBCs
+mesh = generate_mesh(nx=nx, ny=ny)
 
 # -----------------------------------------------------------------------------
 # SIMULATION ------------------------------------------------------------------
 # -----------------------------------------------------------------------------
 
-# Initiate a simulation object. PBCs are specified in the mesh
-sim = Sim(mesh, name='relax_fm')
-# Use default gamma value
-sim.gamma = const.gamma
+# Initiate a simulation object with the interactions of the system:
+# Exchange J = 10 meV, DMI D = 6 meV, Zeeman field B = 25 T and
+# mu_s = 2 mu_B. PBCs are specified in the mesh
+sim = generate_sim(mesh, simname, J=10., D=6., B=25., mu_s=2.)
 
-# Magnetisation in units of Bohr's magneton
-sim.mu_s = 2 * const.mu_B
-
-# We could change the parameters using this option
-# sim.set_options(gamma=const.gamma)
+# For large lattices, the state can be relaxed first on coarse versions of
+# the lattice (see multigrid.py), which reduces the number of steps of the
+# relaxation. With 0 levels (the multigrid option, e.g. 'make relaxation
+# MULTIGRID=2'), the relaxation starts from the init_m function
+if multigrid_levels > 0:
+    init_m = coarse_relaxed_state(init_m, simname,
+                                  J=10., D=6., B=25., mu_s=2., nx=nx, ny=ny,
+                                  levels=multigrid_levels, tols=None)
 
 # Initial magnetisation profile from the function
 sim.set_m(init_m)
 
-# Exchange constant in Joules: E = Sum J_{ij} S_i S_j
-J = (10.0 / 1.) * const.meV
-exch = UniformExchange(J)
-sim.add(exch)
-
-# DMI constant in Joules: E = Sum D_{ij} S_i x S_j
-D = (6 / 1.) * const.meV
-dmi = DMI(D, dmi_type='interfacial')
-sim.add(dmi)
-
-# Zeeman constant in Tesla:
-sim.add(Zeeman((0, 0, 25.)))
-
 # Tune the damping for faster convergence
 sim.driver.alpha = 0.5
 # Remove precession
@@ -92,9 +104,12 @@ sim.driver.do_precession = False
 
 # Relax the system
 # The last state is saved automatically and we also save every 100 steps
+# (only the NPY files, VTK files can be generated with export_vtks.py)
 # We can tune the LLG parameters and stopping criteria if necessary
 # sim.set_tols(rtol=1e-10, atol=1e-12)
 sim.relax(dt=1e-13,
           stopping_dmdt=0.01,
           max_steps=5000,
-          save_m_steps=100, save_vtk_steps=100)
+          save_m_steps=100, save_vtk_steps=None)
+
+cache.save_files(cache_key, [simname + '_npys'])
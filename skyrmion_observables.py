@@ -0,0 +1,218 @@
+from __future__ import print_function
+
+"""
+
+Observables of the skyrmion along the saved bands of an NEBM simulation
+
+To check that the images of a band describe the collapse of the skyrmion
+(and not, e.g., its escape or its drift across the periodic sample), we
+compute for every image of every saved band:
+
+    Q           :: Topological charge, the sum of the solid angles of the
+                   spins of the two triangles of every plaquette of the
+                   lattice (Berg and Luscher), divided by 4 pi. It is an
+                   integer (-1 for a skyrmion with its core against the
+                   background) until the skyrmion collapses
+
+    core_x,
+    core_y      :: Position of the skyrmion core in nm, the circular
+                   (periodic) mean of the positions of the spins in the core,
+                   where the spins are reversed more than half the maximum
+                   reversal of the image. NaN for images without a core
+
+    radius      :: Radius of the area with reversed spins (mz with the
+                   opposite sign to the background), in nm
+
+    min_mz      :: Minimum mz component of the spins
+
+The observables are computed with array operations on stacks of bands of
+shape (steps, images, ny, nx, 3), and saved as tables with the same layout as
+the energy tables, a row for every saved step with the step number and a
+column for every image:
+
+    <simname>_Q.ndt, <simname>_core_x.ndt, <simname>_core_y.ndt,
+    <simname>_radius.ndt, <simname>_min_mz.ndt
+
+The tables are updated with the bands saved since they were last written:
+
+    python skyrmion_observables.py neb_21x21-spins_fm-sk_atomic_k1e4
+
+"""
+
+from band_store import BandReader
+import ndt_reader
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import os
+
+OBSERVABLES = ['Q', 'core_x', 'core_y', 'radius', 'min_mz']
+
+# Approximate size of the stacks of bands processed at once
+CHUNK_BYTES = 32 * 1024 ** 2
+
+# Images where every spin is closer than this to the background have no core
+CORE_THRESHOLD = 0.01
+
+
+def _solid_angle(a, b, c):
+    """
+    Signed solid angle of the spherical triangles of the spins a, b, c,
+    arrays with the spins in the last axis
+    """
+    numerator = np.sum(a * np.cross(b, c), axis=-1)
+    denominator = (1. + np.sum(a * b, axis=-1) + np.sum(b * c, axis=-1) +
+                   np.sum(c * a, axis=-1))
+
+    return 2 * np.arctan2(numerator, denominator)
+
+
+def topological_charge(m):
+    """
+    Topological charge of spin fields with PBCs, m is an array of shape
+    (..., ny, nx, 3). Returns an array with the leading shape
+    """
+    # Neighbours of the bottom left spin (m) of every plaquette
+    m_x = np.roll(m, -1, axis=-2)
+    m_y = np.roll(m, -1, axis=-3)
+    m_xy = np.roll(m_x, -1, axis=-3)
+
+    omega = _solid_angle(m, m_x, m_xy) + _solid_angle(m, m_xy, m_y)
+
+    return np.sum(omega, axis=(-2, -1)) / (4 * np.pi)
+
+
+def _circular_mean(weights, n, d, axis):
+    """
+    Periodic mean position (in nm) along an axis of a lattice of n sites
+    with lattice constant d, with the sites at the centre of the cells
+    """
+    theta = 2 * np.pi * (np.arange(n) + 0.5) / n
+    shape = [1, 1]
+    shape[axis] = n
+    theta = theta.reshape(shape)
+
+    s = np.sum(weights * np.sin(theta), axis=(-2, -1))
+    c = np.sum(weights * np.cos(theta), axis=(-2, -1))
+
+    return (np.arctan2(s, c) % (2 * np.pi)) * n * d / (2 * np.pi)
+
+
+def skyrmion_observables(m, dx=0.5, dy=0.5):
+    """
+    Observables of spin fields with PBCs (see the module docstring)
+
+    m           :: Array of shape (..., ny, nx, 3)
+
+    dx, dy      :: Lattice constants in nm
+
+    Returns a dictionary with arrays of the leading shape of m
+
+    """
+    m = np.asarray(m, dtype=np.float64)
+    ny, nx = m.shape[-3:-1]
+    mz = m[..., 2]
+
+    # Direction of the background of every image, from the majority of the
+    # spins, and reversal of the spins with respect to it
+    background = np.where(np.median(mz, axis=(-2, -1)) < 0, -1., 1.)
+    reversal = 0.5 * (1 - background[..., np.newaxis, np.newaxis] * mz)
+
+    max_reversal = np.max(reversal, axis=(-2, -1))
+    core = np.where(reversal >= 0.5 * max_reversal[..., np.newaxis,
+                                                   np.newaxis],
+                    reversal, 0.)
+    no_core = max_reversal < CORE_THRESHOLD
+    core_x = np.where(no_core, np.nan, _circular_mean(core, nx, dx, axis=1))
+    core_y = np.where(no_core, np.nan, _circular_mean(core, ny, dy, axis=0))
+
+    area = np.sum(reversal > 0.5, axis=(-2, -1)) * dx * dy
+
+    return {'Q': topological_charge(m),
+            'core_x': core_x,
+            'core_y': core_y,
+            'radius': np.sqrt(area / np.pi),
+            'min_mz': np.min(mz, axis=(-2, -1))}
+
+
+def table_path(simname, name):
+    return '{}_{}.ndt'.format(simname, name)
+
+
+def last_step(simname):
+    """
+    Last step in the tables of a simulation, or None if they do not exist
+    """
+    steps = []
+    for name in OBSERVABLES:
+        path = table_path(simname, name)
+        if not os.path.exists(path):
+            return None
+        rows = ndt_reader.tail(path)
+        if not rows.size:
+            return None
+        steps.append(int(rows[-1, 0]))
+
+    return min(steps)
+
+
+def update_tables(simname, nx=21, ny=21, dx=0.5, dy=0.5, force=False,
+                  binary=True):
+    """
+    Append the observables of the bands saved after the last step in the
+    tables of a simulation (or of all the bands, if force is True). With
+    'binary', the binary twins of the tables are saved for ndt_reader.load()
+
+    Returns the number of new rows
+    """
+    reader = BandReader(simname)
+    last = None if force else last_step(simname)
+    steps = [s for s in reader.steps if last is None or s > last]
+    if not steps:
+        return 0
+
+    if last is None:
+        for name in OBSERVABLES:
+            with open(table_path(simname, name), 'w') as f:
+                f.write('# step {}\n'.format(' '.join(
+                    '{}_{}'.format(name, i)
+                    for i in range(reader.n_images))))
+
+    chunk = max(1, CHUNK_BYTES // (reader.n_images * nx * ny * 3 * 8))
+    for a in range(0, len(steps), chunk):
+        bands = np.array([reader.band(s) for s in steps[a:a + chunk]])
+        values = skyrmion_observables(
+            bands.reshape(len(bands), reader.n_images, ny, nx, 3), dx, dy)
+
+        for name in OBSERVABLES:
+            rows = np.column_stack([steps[a:a + chunk], values[name]])
+            with open(table_path(simname, name), 'a') as f:
+                np.savetxt(f, rows, fmt=['%d'] +
+                           ['%.8e'] * reader.n_images)
+
+    if binary:
+        for name in OBSERVABLES:
+            ndt_reader.write_binary(table_path(simname, name))
+
+    return len(steps)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tables with the skyrmion '
+                                     'observables of the bands of NEBM '
+                                     'simulations')
+    parser.add_argument('simnames', nargs='+')
+    parser.add_argument('--nx', type=int, default=21)
+    parser.add_argument('--ny', type=int, default=21)
+    parser.add_argument('--dx', type=float, default=0.5)
+    parser.add_argument('--dy', type=float, default=0.5)
+    parser.add_argument('--force', action='store_true',
+                        help='Compute the tables from scratch')
+    args = parser.parse_args()
+
+    for simname in args.simnames:
+        n = update_tables(simname, args.nx, args.ny, args.dx, args.dy,
+                          args.force)
+        print('{}: {} new steps'.format(simname, n))
@@ -0,0 +1,115 @@
+from __future__ import print_function
+
+"""
+
+Writing of the band snapshots (NPY and VTK files) of the NEBM simulations
+
+The functions save a band in the same layout as the NEBM of Fidimag: a
+folder for every saved step, e.g. npys/<simname>_<step>/, with a file for
+every image. The AsyncWriter class runs these functions in a background thread
+so the relaxation keeps iterating while the files are written; the NEBM
+passes a copy of the band, since it keeps modifying its own array.
+
+"""
+
+# Import the VTK writer from fidimag
+from fidimag.common.vtk import VTK
+
+# Numpy utilities
+import numpy as np
+
+import os
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+def save_band_npys(directory, band):
+    """
+    Save every image of a band (an array with the images in its first axis)
+    as directory/image_XXXXXX.npy
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    for i, image in enumerate(band):
+        np.save(os.path.join(directory, 'image_{:06}.npy'.format(i)), image)
+
+
+def save_band_vtks(mesh, mu_s, directory, band, filename='image'):
+    """
+    Save every image of a band as a VTK file in the directory, with the
+    magnetic moments (mu_s) and the spin directions. The band is an array
+    with the images in its first axis, or a dictionary {number: image} to
+    save only some of the images
+    """
+    images = band.items() if isinstance(band, dict) else enumerate(band)
+
+    vtk = VTK(mesh, directory=directory, filename=filename)
+    for i, image in images:
+        vtk.reset_data()
+        vtk.save_scalar(mu_s, name='mu_s')
+        vtk.save_vector(np.asarray(image).reshape(-1, 3), name='spins')
+        vtk.write_file(step=i)
+
+
+class AsyncWriter(object):
+    """
+    Background thread executing the functions that save files, in order
+
+    maxsize     :: Maximum number of pending snapshots. When the queue is
+                   full, submit() waits, so memory stays bounded if the disk
+                   is slower than the relaxation
+
+    """
+
+    def __init__(self, maxsize=2):
+        self._queue = queue.Queue(maxsize)
+        self._error = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                function, args = job
+                if self._error is None:
+                    function(*args)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def submit(self, function, *args):
+        """
+        Call function(*args) in the background thread. The arguments must not
+        be modified after this call (pass copies of arrays)
+        """
+        if self._error is not None:
+            raise self._error
+        self._queue.put((function, args))
+
+    def flush(self):
+        """
+        Wait until every submitted snapshot is written
+        """
+        self._queue.join()
+        if self._error is not None:
+            raise self._error
+
+    def close(self):
+        """
+        Write the pending snapshots and stop the thread
+        """
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
@@ -0,0 +1,221 @@
+from __future__ import print_function
+
+"""
+
+Parameter sweep of NEBM simulations for the toy model of Fe-like atoms in a
+square lattice with interfacial DMI
+
+Every point of the grid made of the spring constant k, the exchange J, the DMI
+D, the magnetic field B, the lattice size and the number of images of the band,
+is simulated in a process pool: first the skyrmion and ferromagnetic states are
+relaxed (these are shared by points with the same physical system) and then
+the energy band is relaxed with the NEBM.
+
+Every point runs inside its own folder of the output directory. When a point
+finishes, a row is appended to the results index (sweep_index.txt) with the
+energy barrier (meV), the saddle image, the number of iterations and the wall
+time (s) of the simulation. Points already in the index are skipped and
+interrupted bands are restarted from their latest saved step, thus an
+interrupted sweep is resumed by running the same command again.
+
+Example:
+
+    python sweep_neb.py --D 5 5.5 6 --B 20 25 30 --sizes 21 31 -o sweep_DB
+
+"""
+
+from neb_relaxation import (relax_neb, relax_state,
+                            init_m_fm, init_m_sk)
+import ndt_reader
+
+# Numpy utilities
+import numpy as np
+
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+
+meV = 1e-3 * 1.602e-19
+
+INDEX_FILE = 'sweep_index.txt'
+INDEX_HEADER = ('label k J D B nx ny images '
+                'barrier saddle_image iterations wall_time')
+
+
+def point_label(k, J, D, B, n, images):
+    """
+    Name of a sweep point, used for the folder and the index
+    """
+    return 'k{:g}_J{:g}_D{:g}_B{:g}_{}x{}_im{}'.format(k, J, D, B, n, n,
+                                                       images)
+
+
+def relaxed_endpoints(outdir, J, D, B, mu_s, n, multigrid_levels=0):
+    """
+    Load or compute the skyrmion and ferromagnetic states for a system. The
+    states are saved in the 'endpoints' folder of the sweep directory
+    """
+    folder = os.path.join(outdir, 'endpoints')
+    if not os.path.exists(folder):
+        try:
+            os.makedirs(folder)
+        except OSError:
+            # Another worker created it
+            pass
+
+    label = 'J{:g}_D{:g}_B{:g}_{}x{}'.format(J, D, B, n, n)
+    states = []
+    for state, init_m, tols in [('sk', init_m_sk(n, n), (1e-10, 1e-12)),
+                                ('fm', init_m_fm, None)]:
+        path = os.path.join(folder, '{}_{}.npy'.format(label, state))
+        if not os.path.exists(path):
+            m = relax_state(init_m, 'relax_{}_{}'.format(state, label),
+                            J=J, D=D, B=B, mu_s=mu_s, nx=n, ny=n, tols=tols,
+                            multigrid_levels=multigrid_levels)
+            # Write and rename so other workers never read half a file
+            tmp = path[:-4] + '_{}.tmp.npy'.format(os.getpid())
+            np.save(tmp, m)
+            os.rename(tmp, path)
+        states.append(np.load(path))
+
+    return states
+
+
+def run_point(args):
+    """
+    Simulate a point of the sweep and return its row for the index
+    """
+    (outdir, k, J, D, B, n, images,
+     maxst, stopping_dYdt, save_every, mu_s, multigrid_levels) = args
+
+    label = point_label(k, J, D, B, n, images)
+    folder = os.path.join(outdir, label)
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+    # Fidimag saves the files in the working directory. The processes of the
+    # pool are reused so we always go back to the original directory
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        t0 = time.time()
+        init_im = relaxed_endpoints(outdir, J, D, B, mu_s, n,
+                                    multigrid_levels)
+        relax_neb(k, maxst, label, init_im, [images - 2],
+                  save_every=save_every, stopping_dYdt=stopping_dYdt,
+                  J=J, D=D, B=B, mu_s=mu_s, nx=n, ny=n, resume=True,
+                  multigrid_levels=multigrid_levels)
+        # The first column is the step number
+        data_energy = ndt_reader.tail(label + '_energy.ndt')[-1]
+    finally:
+        os.chdir(cwd)
+
+    energies = data_energy[1:]
+    row = [label, k, J, D, B, n, n, images,
+           (np.max(energies) - energies[0]) / meV,
+           int(np.argmax(energies)),
+           int(data_energy[0]),
+           time.time() - t0]
+
+    return row
+
+
+def finished_points(outdir):
+    """
+    Labels of the points already in the results index
+    """
+    path = os.path.join(outdir, INDEX_FILE)
+    if not os.path.exists(path):
+        return set()
+
+    with open(path) as f:
+        return set(line.split()[0] for line in f
+                   if line.strip() and not line.startswith('#'))
+
+
+def sweep(outdir, ks, Js, Ds, Bs, sizes, images,
+          maxst=2000, stopping_dYdt=0.01, save_every=10000, mu_s=2.,
+          multigrid_levels=0, processes=None):
+    """
+    Run the NEBM for every point of the grid, skipping the points already
+    in the results index of 'outdir'
+
+    ks, Js, Ds,
+    Bs          :: Lists with the spring constants and the material
+                   parameters (J, D in meV and B in T)
+
+    sizes       :: List with the number of spins along x and y
+
+    images      :: List with the total number of images of the band
+
+    multigrid_levels
+                :: Number of coarse lattices used to relax the states and
+                   the bands first (see relax_neb)
+
+    processes   :: Number of processes of the pool (all cores by default)
+
+    """
+
+    # Workers change their directory, so we use an absolute path
+    outdir = os.path.abspath(outdir)
+    if not os.path.exists(outdir):
+        os.makedirs(outdir)
+
+    done = finished_points(outdir)
+    points = [(outdir, k, J, D, B, n, im, maxst, stopping_dYdt, save_every,
+               mu_s, multigrid_levels)
+              for k, J, D, B, n, im in itertools.product(ks, Js, Ds, Bs,
+                                                         sizes, images)
+              if point_label(k, J, D, B, n, im) not in done]
+
+    print('{} points to simulate ({} already finished)'.format(len(points),
+                                                               len(done)))
+    if not points:
+        return
+
+    path = os.path.join(outdir, INDEX_FILE)
+    if not os.path.exists(path):
+        with open(path, 'w') as f:
+            f.write('# ' + INDEX_HEADER + '\n')
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        # Only this process writes to the index, one row per finished point,
+        # so an interruption loses at most the points being simulated
+        for row in pool.imap_unordered(run_point, points):
+            with open(path, 'a') as f:
+                f.write('{} {:g} {:g} {:g} {:g} {} {} {} '
+                        '{:.8f} {} {} {:.2f}\n'.format(*row))
+            print('Finished {} -- barrier: {:.4f} meV'.format(row[0], row[8]))
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parameter sweep of NEBM '
+                                     'simulations of the sk-fm system')
+    parser.add_argument('-o', '--outdir', default='sweep')
+    parser.add_argument('--k', nargs='+', type=float, default=[1e4])
+    parser.add_argument('--J', nargs='+', type=float, default=[10.])
+    parser.add_argument('--D', nargs='+', type=float, default=[6.])
+    parser.add_argument('--B', nargs='+', type=float, default=[25.])
+    parser.add_argument('--sizes', nargs='+', type=int, default=[21])
+    parser.add_argument('--images', nargs='+', type=int, default=[18])
+    parser.add_argument('--maxst', type=int, default=2000)
+    parser.add_argument('--stopping_dYdt', type=float, default=0.01)
+    parser.add_argument('--save_every', type=int, default=10000)
+    parser.add_argument('--multigrid', type=int, default=0,
+                        help='Number of coarse lattices (for large sizes)')
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    sweep(args.outdir, args.k, args.J, args.D, args.B, args.sizes,
+          args.images, maxst=args.maxst, stopping_dYdt=args.stopping_dYdt,
+          save_every=args.save_every, multigrid_levels=args.multigrid,
+          processes=args.processes)
@@ -0,0 +1,111 @@
+"""
+
+Construction of the simulation objects of the toy model of Fe-like atoms
+arranged in a square lattice with interfacial DMI, which are used by the
+relaxation scripts, the NEBM simulations and the Povray scripts.
+
+Magnetic parameters (default values):
+    J = 10 meV      Exchange
+    D = 6 meV       DMI
+    B = 25 T        Magnetic Field
+    mu_s = 2 mu_B   Magnetic moment
+
+Building a mesh computes the neighbours of every spin, thus the meshes are
+cached in this module and shared by every simulation with the same lattice
+size. Every call of generate_sim or neb_sim creates a fresh Simulation
+object, since its spins, fields and driver settings are changed by the
+relaxations.
+
+"""
+
+# FIDIMAG Simulation imports:
+from fidimag.atomistic import Sim
+from fidimag.common import CuboidMesh
+from fidimag.atomistic import DMI
+from fidimag.atomistic import UniformExchange
+from fidimag.atomistic import Zeeman
+# Import physical constants from fidimag
+import fidimag.common.constant as const
+
+
+# Cache of this process
+_meshes = {}
+
+
+# MESH ------------------------------------------------------------------------
+
+def generate_mesh(nx=21, ny=21, dx=0.5, dy=0.5):
+    """
+    Square lattice of nx * ny spins with a lattice constant of 5 angstrom
+    and PBCs. The mesh is created only once for every lattice size.
+    Other lattice constants dx, dy (in nm) are used for the coarse versions
+    of the system (see multigrid.py)
+    """
+    key = (nx, ny, dx, dy)
+    if key not in _meshes:
+        _meshes[key] = CuboidMesh(nx=nx, ny=ny,
+                                  dx=dx, dy=dy,
+                                  unit_length=1e-9,
+                                  periodicity=(True, True, False)
+                                  )
+
+    return _meshes[key]
+
+# -----------------------------------------------------------------------------
+
+
+# Simulation ------------------------------------------------------------------
+
+def generate_sim(mesh, name, J=10., D=6., B=25., mu_s=2.):
+    """
+    Create a Simulation object with the exchange, DMI and Zeeman
+    interactions of the system
+
+    mesh        :: Fidimag mesh, e.g. from generate_mesh()
+
+    name        :: Simulation name
+
+    J, D        :: Exchange and DMI constants in meV
+
+    B           :: Magnitude of the field, perpendicular to the sample, in T
+
+    mu_s        :: Magnetic moment in units of Bohr's magneton
+
+    """
+
+    # Initialise a simulation object and set the default gamma for the LLG
+    # equation
+    sim = Sim(mesh, name=name)
+    sim.gamma = const.gamma
+
+    # Magnetisation in units of Bohr's magneton
+    sim.mu_s = mu_s * const.mu_B
+
+    # Exchange constant in Joules: E = Sum J_{ij} S_i S_j
+    exch = UniformExchange(J * const.meV)
+    sim.add(exch)
+
+    # DMI constant in Joules: E = Sum D_{ij} S_i x S_j
+    dmi = DMI(D * const.meV, dmi_type='interfacial')
+    sim.add(dmi)
+
+    # Zeeman field in Tesla:
+    sim.add(Zeeman((0, 0, B)))
+
+    return sim
+
+
+def neb_sim(J=10., D=6., B=25., mu_s=2., nx=21, ny=21, dx=0.5, dy=0.5):
+    """
+    Fresh simulation object for an NEBM simulation of a system, on the
+    cached mesh of its lattice size
+    """
+    return generate_sim(generate_mesh(nx, ny, dx, dy),
+                        'neb_{}x{}-spins_fm-sk_atomic'.format(nx, ny),
+                        J, D, B, mu_s)
+
+
+def clear_cache():
+    _meshes.clear()
+
+# -----------------------------------------------------------------------------
@@ -0,0 +1,77 @@
+"""
+
+Lattice size, number of images of the bands and precision of the saved bands
+used by the simulation and plotting scripts, and multigrid levels of the
+relaxations
+
+The options are read from the environment variables
+
+    NEBM_NX         :: Number of spins along x (21)
+    NEBM_NY         :: Number of spins along y (NEBM_NX)
+    NEBM_IMAGES     :: Number of images of the energy bands (18)
+    NEBM_FLOAT32    :: If 1, the bands are saved in single precision (0)
+    NEBM_MULTIGRID  :: Number of coarse lattices where the states of the
+                       relaxation folder are relaxed first (0), see
+                       multigrid.py
+
+which are set by the pipeline (see pipeline.py, or 'make all NX=101'), so
+every script of a run uses the same system. The defaults are the system of
+the paper. This module does not import Fidimag, so the plotting scripts can
+use it.
+
+"""
+
+import os
+
+
+def script_options():
+    """
+    Dictionary with the nx, ny, images, float32 and multigrid options
+    """
+    nx = int(os.environ.get('NEBM_NX', 21))
+
+    return {'nx': nx,
+            'ny': int(os.environ.get('NEBM_NY', nx)),
+            'images': int(os.environ.get('NEBM_IMAGES', 18)),
+            'float32': os.environ.get('NEBM_FLOAT32', '0') not in ['', '0'],
+            'multigrid': int(os.environ.get('NEBM_MULTIGRID', 0))}
+
+
+def option_environment(nx=21, ny=None, images=18, float32=False,
+                       multigrid=0):
+    """
+    Environment variables for the options, to run the scripts
+    """
+    return {'NEBM_NX': str(nx),
+            'NEBM_NY': str(nx if ny is None else ny),
+            'NEBM_IMAGES': str(images),
+            'NEBM_FLOAT32': '1' if float32 else '0',
+            'NEBM_MULTIGRID': str(multigrid)}
+
+
+def simulation_name(prefix, nx=21, ny=21, k='1e4', images=18,
+                    float32=False):
+    """
+    Name of the NEBM simulations of the scripts, e.g.
+    neb_21x21-spins_fm-sk_atomic_k1e4. A number of images other than the
+    default and single precision bands are added to the name, e.g.
+    neb_21x21-spins_fm-sk_atomic_k1e4_24-images_float32, so a run with
+    other options is not resumed from (or mistaken for) the files of a
+    previous run
+    """
+    name = '{}_{}x{}-spins_fm-sk_atomic_k{}'.format(prefix, nx, ny, k)
+    if images != 18:
+        name += '_{}-images'.format(images)
+    if float32:
+        name += '_float32'
+
+    return name
+
+
+def relaxation_name(state, nx=21, ny=21):
+    """
+    Name of the relaxation of a state ('fm' or 'sk') in the relaxation
+    folder, e.g. relax_sk_21x21, whose last NPY file is the initial image
+    of the NEBM simulations
+    """
+    return 'relax_{}_{}x{}'.format(state, nx, ny)